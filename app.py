@@ -1,7 +1,8 @@
 import html
+import json
 import os
-import tempfile
-import uuid
+import shutil
+import time
 
 import requests
 import streamlit as st
@@ -221,13 +222,21 @@ if not os.getenv("HF_TOKEN"):
 
 API_BASE = os.getenv("RAG_API_BASE", "").strip().rstrip("/")
 USE_REMOTE_API = bool(API_BASE)
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "").strip()
 
 
 @st.cache_resource
 def get_local_engine():
     from rag_core import RAGEngine
 
-    return RAGEngine()
+    engine = RAGEngine()
+    if INDEX_DIR and os.path.exists(os.path.join(INDEX_DIR, "meta.json")):
+        try:
+            engine.load(INDEX_DIR)
+        except Exception as e:
+            print(f"Snapshot yüklenemedi, boş indeksle devam ediliyor: {e}")
+            engine.reset()
+    return engine
 
 
 @st.cache_data
@@ -244,17 +253,17 @@ def get_local_llm_info():
 def local_reset():
     engine = get_local_engine()
     engine.reset()
+    if INDEX_DIR:
+        shutil.rmtree(INDEX_DIR, ignore_errors=True)
 
 
 def local_upload(uploaded_file):
+    # UploadedFile zaten bellekte; geçici dosyaya yazmadan doğrudan okunur
     engine = get_local_engine()
-    name = f"uploaded_{uuid.uuid4().hex}.pdf"
-    path = os.path.join(tempfile.gettempdir(), name)
-
-    with open(path, "wb") as f:
-        f.write(uploaded_file.getvalue())
-
-    engine.build_from_pdf(path, doc_id=uploaded_file.name)
+    uploaded_file.seek(0)
+    engine.build_from_pdf(uploaded_file, doc_id=uploaded_file.name)
+    if INDEX_DIR:
+        engine.save(INDEX_DIR)
 
 
 def local_ask(question: str, top_k: int, doc_id: str | None):
@@ -267,16 +276,56 @@ def local_ask(question: str, top_k: int, doc_id: str | None):
 
 def local_ask_stream(question: str, top_k: int, doc_id: str | None):
     engine = get_local_engine()
-    for chunk in engine.ask_stream(question, top_k=top_k, doc_id=doc_id):
-        if chunk.startswith("[ERROR]"):
-            raise RuntimeError(chunk.replace("[ERROR]", "", 1).strip())
-        yield chunk
+    for event in engine.ask_stream(question, top_k=top_k, doc_id=doc_id):
+        if "hata" in event:
+            raise RuntimeError(event["hata"])
+        yield event
+
+
+def wait_for_ingest_job(job_id: str, file_name: str, status):
+    # Sunucu PDF'i arka planda işler; iş bitene kadar ilerleme gösterilir
+    while True:
+        response = requests.get(f"{API_BASE}/jobs/{job_id}", timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(response.text)
+
+        job = response.json()
+        if job["status"] == "done":
+            return
+        if job["status"] == "failed":
+            raise RuntimeError(job.get("error") or "Upload hatası oluştu.")
+
+        if job.get("pages_total"):
+            status.update(
+                label=f"{file_name}: {job['pages_parsed']}/{job['pages_total']} sayfa, {job['chunks_embedded']} parça"
+            )
+        time.sleep(1)
+
+
+def iter_sse_events(response):
+    # (olay adı, veri) çiftleri; çok satırlı "data:" alanları "\n" ile birleştirilir
+    response.encoding = "utf-8"
+    event_name, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event_name, "\n".join(data_lines)
+            event_name, data_lines = "message", []
+        elif line.startswith("event: "):
+            event_name = line[len("event: "):]
+        elif line.startswith("data: "):
+            data_lines.append(line[len("data: "):])
+    if data_lines:
+        yield event_name, "\n".join(data_lines)
 
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "indexed_files" not in st.session_state:
-    st.session_state.indexed_files = []
+    # Local modda snapshot'tan açılan dokümanlar listede görünsün
+    st.session_state.indexed_files = [] if USE_REMOTE_API else get_local_engine().doc_ids()
 if "active_doc_id" not in st.session_state:
     st.session_state.active_doc_id = None
 
@@ -327,10 +376,12 @@ with st.sidebar:
                 try:
                         for file in uploaded_files:
                             if USE_REMOTE_API:
-                                files = {"file": (file.name, file.getvalue(), "application/pdf")}
+                                file.seek(0)
+                                files = {"file": (file.name, file, "application/pdf")}
                                 response = requests.post(f"{API_BASE}/upload", files=files, timeout=300)
-                                if response.status_code != 200:
+                                if response.status_code not in (200, 202):
                                     raise RuntimeError(response.text)
+                                wait_for_ingest_job(response.json()["job_id"], file.name, status)
                             else:
                                 local_upload(file)
 
@@ -403,12 +454,11 @@ if prompt := st.chat_input("Buraya bir soru yazın..."):
                         if r.status_code != 200:
                             st.error(f"Sunucu Hatası: {r.text}")
                         else:
-                            for line in r.iter_lines(decode_unicode=True):
-                                if not line or not line.startswith("data: "):
+                            for event_name, chunk in iter_sse_events(r):
+                                if event_name == "sources":
+                                    sources = json.loads(chunk)
                                     continue
 
-                                chunk = line.replace("data: ", "", 1)
-
                                 if chunk == "[DONE]":
                                     break
 
@@ -440,12 +490,15 @@ if prompt := st.chat_input("Buraya bir soru yazın..."):
                     else:
                         st.error(f"Sunucu Hatası: {r.status_code} - {r.text}")
                 elif is_streaming:
-                    for chunk in local_ask_stream(
+                    for event in local_ask_stream(
                         prompt,
                         top_k=top_k,
                         doc_id=st.session_state.active_doc_id,
                     ):
-                        full_response += chunk
+                        if "kaynaklar" in event:
+                            sources = event["kaynaklar"]
+                            continue
+                        full_response += event["token"]
                         message_placeholder.markdown(full_response + " ▌")
                     if full_response:
                         message_placeholder.markdown(full_response)
@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from rag_core import IndexVectors, make_index, min_train_size, search_params
+
+
+# --------------------------------------------------
+# VERİ
+# --------------------------------------------------
+def clustered_unit(rng, centers, n, spread):
+    # Birim merkezler + merkez boyunda (spread=1) gürültü; kümeler birbirine karışır
+    labels = rng.integers(0, len(centers), size=n)
+    noise = rng.standard_normal((n, centers.shape[1])).astype("float32") * (spread / np.sqrt(centers.shape[1]))
+    x = centers[labels] + noise
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def synthetic_vectors(rng, n_docs, n_queries, dim, n_clusters, spread, query_spread):
+    # Dar kümeli veride IVF nprobe=1 ile bile recall 1.0 çıkar ve ayar seçilemez. Sorgular
+    # ne doküman ne küme merkezi: aynı merkezler etrafında daha geniş gürültüyle üretilir
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    return clustered_unit(rng, centers, n_docs, spread), clustered_unit(rng, centers, n_queries, query_spread)
+
+
+def add_data_args(parser):
+    parser.add_argument("--n-docs", type=int, default=100000)
+    parser.add_argument("--n-queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=1.25, help="doküman gürültüsü / merkez boyu")
+    parser.add_argument("--query-spread", type=float, default=1.5, help="sorgu gürültüsü / merkez boyu")
+    parser.add_argument("--snapshot", default="", help="RAGEngine snapshot dizini (gerçek embedding'ler; önerilen)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def snapshot_vectors(path: str):
+    # Canlı satırların float32 vektörleri. Sıkıştırılmış (float16 / int8 / PQ) snapshot'larda
+    # embeddings.npy yazılmaz; vektörler index.faiss'ten çözülür
+    alive_path = os.path.join(path, "alive.npy")
+    alive = np.load(alive_path) if os.path.exists(alive_path) else None
+
+    embeddings_path = os.path.join(path, "embeddings.npy")
+    if os.path.exists(embeddings_path):
+        vectors = np.load(embeddings_path, mmap_mode="r")
+        rows = np.flatnonzero(alive) if alive is not None else np.arange(len(vectors))
+        return np.asarray(vectors[rows], dtype="float32")
+
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    rows = np.flatnonzero(alive) if alive is not None else np.arange(index.ntotal)
+    return IndexVectors(index)[rows]
+
+
+def load_vectors(args, rng):
+    if args.snapshot:
+        vectors = snapshot_vectors(args.snapshot)
+        order = rng.permutation(len(vectors))
+        n_queries = min(args.n_queries, len(vectors) // 10)
+        return vectors[order[n_queries:]], vectors[order[:n_queries]]
+
+    return synthetic_vectors(
+        rng, args.n_docs, args.n_queries, args.dim, args.clusters, args.spread, args.query_spread
+    )
+
+
+# --------------------------------------------------
+# ÖLÇÜM
+# --------------------------------------------------
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(index, queries, k, params):
+    # RAGEngine gibi tek sorguluk aramalar: sorgu başına gecikme
+    found = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, q in enumerate(queries):
+        _, idx = index.search(q[None, :], k, params=params)
+        found[i] = idx[0]
+    elapsed = time.perf_counter() - start
+    return found, elapsed / len(queries) * 1000
+
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS indeks tipleri için recall / gecikme raporu")
+    add_data_args(parser)
+    parser.add_argument("--k", type=int, default=12)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base, queries = load_vectors(args, rng)
+    dim = base.shape[1]
+    print(f"Vektör: {len(base)} x {dim}, sorgu: {len(queries)}, k={args.k}")
+
+    if len(base) < min_train_size("ivfpq"):
+        print(f"Uyarı: {len(base)} vektör ile RAGEngine IVF/PQ eğitmez, flat kullanır.")
+
+    flat = make_index("flat", dim)
+    flat.add(base)
+    truth, flat_ms = run(flat, queries, args.k, None)
+
+    print(f"\n{'mod':<8} {'ayar':<14} {'kurulum s':>10} {'recall@k':>9} {'ms/sorgu':>9} {'hız':>7}")
+    print(f"{'flat':<8} {'-':<14} {'-':>10} {1.0:>9.3f} {flat_ms:>9.3f} {1.0:>6.1f}x")
+
+    sweeps = {
+        "hnsw": [("ef_search", v) for v in (16, 32, 64, 128, 256)],
+        "ivf": [("nprobe", v) for v in (1, 4, 8, 16, 32, 64)],
+        "ivfpq": [("nprobe", v) for v in (1, 4, 8, 16, 32, 64)],
+    }
+
+    for index_type, settings in sweeps.items():
+        start = time.perf_counter()
+        index = make_index(index_type, dim, base)
+        index.add(base)
+        build_s = time.perf_counter() - start
+
+        for name, value in settings:
+            params = search_params(index, **{name: value})
+            found, ms = run(index, queries, args.k, params)
+            print(
+                f"{index_type:<8} {f'{name}={value}':<14} {build_s:>10.2f} "
+                f"{recall_at_k(found, truth):>9.3f} {ms:>9.3f} {flat_ms / ms:>6.1f}x"
+            )
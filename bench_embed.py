@@ -0,0 +1,102 @@
+import argparse
+import time
+
+import numpy as np
+
+from embedding_backend import ONNX_THREADS, OnnxEncoder, TorchEncoder
+from rag_core import iter_chunks, iter_pdf_pages
+
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+_WORDS = (
+    "sözleşme madde fatura ödeme tarih teslim müşteri ürün rapor yönetmelik kurul "
+    "karar başvuru süre gün ay yıl tutar vergi banka hesap şirket personel izin "
+    "eğitim sınav sonuç belge imza onay iptal iade garanti servis arıza bakım"
+).split()
+
+
+# --------------------------------------------------
+# VERİ
+# --------------------------------------------------
+def load_texts(args, rng):
+    if args.pdf:
+        texts = [c["text"] for c in iter_chunks(iter_pdf_pages(args.pdf), "bench")]
+        return texts[: args.n_texts]
+    # Chunk boyutuna yakın (~100-130 kelime) yapay Türkçe metinler
+    return [" ".join(rng.choice(_WORDS, size=int(rng.integers(100, 130)))) for _ in range(args.n_texts)]
+
+
+# --------------------------------------------------
+# ÖLÇÜM
+# --------------------------------------------------
+def throughput(encoder, texts, batch_size):
+    encoder.encode(texts[:batch_size], batch_size=batch_size)
+    start = time.perf_counter()
+    vectors = encoder.encode(texts, batch_size=batch_size)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def query_latency(encoder, queries):
+    # Tek soruluk (micro-batch'siz) sorgu gecikmesi
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        encoder.encode([q], batch_size=1)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 95)
+
+
+def neighbour_agreement(vectors, reference, n_queries, k):
+    # Referans (torch) komşularının kaçı bu backend'in ilk k komşusunda da var
+    def knn(x):
+        sims = x[:n_queries] @ x.T
+        np.fill_diagonal(sims[:, :n_queries], -np.inf)
+        return np.argsort(-sims, axis=1)[:, :k]
+
+    found, truth = knn(vectors), knn(reference)
+    return np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding backend'leri (torch / onnx / onnx-int8) karşılaştırması")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--pdf", default="", help="Metinler bu PDF'in chunk'larından alınır")
+    parser.add_argument("--n-texts", type=int, default=512)
+    parser.add_argument("--n-queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=ONNX_THREADS)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    texts = load_texts(args, rng)
+    queries = [" ".join(t.split()[:12]) for t in texts[: args.n_queries]]
+    print(f"Metin: {len(texts)}, sorgu: {len(queries)}, batch={args.batch_size}, onnx thread={args.threads}")
+
+    encoders = [
+        TorchEncoder(args.model, "cpu"),
+        OnnxEncoder(args.model, quantize=False, threads=args.threads),
+        OnnxEncoder(args.model, quantize=True, threads=args.threads),
+    ]
+
+    print(
+        f"\n{'backend':<24} {'metin/s':>8} {'hız':>6} {'sorgu p50':>10} {'p95 ms':>7} "
+        f"{'cos ort':>8} {'cos min':>8} {f'komşu@{args.k}':>9}"
+    )
+    reference, base_rate = None, None
+    for encoder in encoders:
+        vectors, rate = throughput(encoder, texts, args.batch_size)
+        p50, p95 = query_latency(encoder, queries)
+        if reference is None:
+            reference, base_rate = vectors, rate
+
+        cos = np.sum(vectors * reference, axis=1)
+        agree = neighbour_agreement(vectors, reference, min(args.n_queries, len(texts)), args.k)
+        print(
+            f"{encoder.name:<24} {rate:>8.1f} {rate / base_rate:>5.1f}x {p50:>10.2f} {p95:>7.2f} "
+            f"{cos.mean():>8.4f} {cos.min():>8.4f} {agree:>9.3f}"
+        )
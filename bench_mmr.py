@@ -0,0 +1,89 @@
+import argparse
+import time
+
+import numpy as np
+
+from rag_core import mmr_select
+
+
+# --------------------------------------------------
+# ESKİ (DÖNGÜLÜ) MMR - karşılaştırma için
+# --------------------------------------------------
+def mmr_select_loop(query_vec, doc_vecs, candidates, k=3, lam=0.65):
+    selected = []
+
+    while candidates and len(selected) < k:
+        best = None
+        best_score = -1e9
+
+        for idx in candidates:
+            rel = float(np.dot(query_vec, doc_vecs[idx]))
+            div = (
+                max([float(np.dot(doc_vecs[idx], doc_vecs[s])) for s in selected])
+                if selected
+                else 0.0
+            )
+            score = lam * rel - (1 - lam) * div
+
+            if score > best_score:
+                best_score = score
+                best = idx
+
+        selected.append(best)
+        candidates.remove(best)
+
+    return selected
+
+
+def random_unit(rng, n, dim):
+    x = rng.standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat * 1000, out
+
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="mmr_select döngü vs NumPy karşılaştırması")
+    parser.add_argument("--n-docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    doc_vecs = random_unit(rng, args.n_docs, args.dim)
+
+    # (top_k, search_k, lam): QA modu ve summary modu slider aralığında
+    cases = [
+        (6, 12, 0.65),
+        (6, 24, 0.82),
+        (10, 20, 0.65),
+        (15, 60, 0.82),
+    ]
+
+    print(f"{'top_k':>5} {'aday':>5} {'lam':>5} {'döngü ms':>10} {'numpy ms':>10} {'hız':>7}  aynı")
+    for top_k, search_k, lam in cases:
+        query = random_unit(rng, 1, args.dim)[0]
+        candidates = [int(i) for i in rng.choice(args.n_docs, size=search_k, replace=False)]
+
+        loop_ms, loop_out = timed(
+            lambda: mmr_select_loop(query, doc_vecs, candidates.copy(), k=top_k, lam=lam),
+            args.repeat,
+        )
+        vec_ms, vec_out = timed(
+            lambda: mmr_select(query, doc_vecs, candidates, k=top_k, lam=lam),
+            args.repeat,
+        )
+
+        print(
+            f"{top_k:>5} {search_k:>5} {lam:>5} {loop_ms:>10.3f} {vec_ms:>10.3f} "
+            f"{loop_ms / vec_ms:>6.1f}x  {loop_out == vec_out}"
+        )
@@ -0,0 +1,79 @@
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from bench_ann import add_data_args, load_vectors, recall_at_k, run
+from rag_core import VECTOR_STORAGES, IndexVectors, make_index, mmr_select, search_params
+
+
+# --------------------------------------------------
+# ÖLÇÜM
+# --------------------------------------------------
+def build(index_type, storage, base):
+    # RAGEngine ile aynı kurulum: ID = satır no, IVF sarılmaz
+    start = time.perf_counter()
+    index = make_index(index_type, base.shape[1], base, storage)
+    if isinstance(index, faiss.IndexIVF):
+        if storage != "float32":
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        index = faiss.IndexIDMap2(index)
+    index.add_with_ids(base, np.arange(len(base), dtype="int64"))
+    return index, time.perf_counter() - start
+
+
+def vector_bytes(index, base, storage):
+    # float32 modunda MMR için ayrıca tutulan embedding kopyası da sayılır
+    total = faiss.serialize_index(index).nbytes
+    if storage == "float32":
+        total += base.nbytes
+    return total
+
+
+def mmr_ms(index, base, storage, queries, k, n_candidates):
+    # Sorgu başına aday vektörlerinin okunup MMR'ın çalıştırılma süresi
+    vectors = base if storage == "float32" else IndexVectors(index)
+    _, cands = index.search(queries, n_candidates)
+    start = time.perf_counter()
+    for q, cand in zip(queries, cands):
+        mmr_select(q, vectors, [int(c) for c in cand if c >= 0], k=k)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vektör depolama (float32 / float16 / int8) için recall / gecikme / bellek raporu")
+    add_data_args(parser)
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--index-types", default="flat,hnsw,ivf")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base, queries = load_vectors(args, rng)
+    dim = base.shape[1]
+    print(f"Vektör: {len(base)} x {dim}, sorgu: {len(queries)}, k={args.k}")
+
+    # Doğruluk referansı: float32 birebir arama
+    exact = make_index("flat", dim)
+    exact.add(base)
+    truth, _ = run(exact, queries, args.k, None)
+
+    print(
+        f"\n{'indeks':<6} {'depolama':<8} {'kurulum s':>9} {'recall@k':>9} "
+        f"{'ms/sorgu':>9} {'mmr ms':>7} {'MB':>8} {'byte/vek':>9}"
+    )
+    for index_type in args.index_types.split(","):
+        for storage in VECTOR_STORAGES:
+            index, build_s = build(index_type, storage, base)
+            params = search_params(index, nprobe=16, ef_search=128)
+            found, ms = run(index, queries, args.k, params)
+            size = vector_bytes(index, base, storage)
+            mmr = mmr_ms(index, base, storage, queries[:100], 6, args.k * 2)
+            print(
+                f"{index_type:<6} {storage:<8} {build_s:>9.2f} {recall_at_k(found, truth):>9.3f} "
+                f"{ms:>9.3f} {mmr:>7.3f} {size / 2**20:>8.1f} {size / len(base):>9.0f}"
+            )
@@ -0,0 +1,76 @@
+import json
+import os
+
+import numpy as np
+
+# Snapshot içinde chunk'lar: metinler tek UTF-8 blob'da, satır bilgileri npy dizilerinde.
+# Böylece chunk'lar process'ler arasında bellek eşlemeli (mmap) paylaşılabilir;
+# chunks.json gibi her process'te ayrı Python nesnelerine açılmaz.
+
+
+def save_chunks(path: str, chunks):
+    os.makedirs(path, exist_ok=True)
+    doc_names = {}
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    chunk_ids = np.zeros(len(chunks), dtype=np.int32)
+    doc_index = np.zeros(len(chunks), dtype=np.int32)
+
+    with open(os.path.join(path, "text.bin"), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            data = chunk["text"].encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+            chunk_ids[i] = chunk["chunk_id"]
+            doc_index[i] = doc_names.setdefault(chunk["doc_id"], len(doc_names))
+
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "chunk_ids.npy"), chunk_ids)
+    np.save(os.path.join(path, "doc_index.npy"), doc_index)
+    with open(os.path.join(path, "doc_names.json"), "w", encoding="utf-8") as f:
+        json.dump(list(doc_names), f, ensure_ascii=False)
+
+
+class MappedChunks:
+    # chunks listesinin salt-okunur karşılığı: chunks[i] her erişimde dict olarak çözülür
+    def __init__(self, path: str):
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(path, "chunk_ids.npy"), mmap_mode="r")
+        self.doc_index = np.load(os.path.join(path, "doc_index.npy"), mmap_mode="r")
+        with open(os.path.join(path, "doc_names.json"), encoding="utf-8") as f:
+            self.doc_names = json.load(f)
+
+        # Boş dosya eşlenemez
+        text_path = os.path.join(path, "text.bin")
+        if os.path.getsize(text_path):
+            self.text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self.text = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def _chunk(self, i: int) -> dict:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return {
+            "doc_id": self.doc_names[int(self.doc_index[i])],
+            "chunk_id": int(self.chunk_ids[i]),
+            "text": self.text[start:end].tobytes().decode("utf-8"),
+        }
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._chunk(j) for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._chunk(i)
+
+    def __iter__(self):
+        return (self._chunk(i) for i in range(len(self)))
+
+
+def load_chunks(path: str, mmap: bool = False):
+    chunks = MappedChunks(path)
+    return chunks if mmap else list(chunks)
@@ -0,0 +1,136 @@
+import copy
+import os
+import threading
+
+# Boşsa embedding modelinin tokenizer'ı kullanılır; LLM'in tokenizer'ı yerelde
+# varsa (örn. "Qwen/Qwen2.5-7B-Instruct") daha doğru sayım için buraya verilebilir
+CONTEXT_TOKENIZER = os.getenv("RAG_CONTEXT_TOKENIZER", "")
+
+# Tokenizer yoksa kaba tahmin: Türkçe metinde token başına ~3.5 karakter
+CHARS_PER_TOKEN = 3.5
+
+# Komşu chunk'lar arasında aranacak en uzun örtüşme (chunk_text overlap=150 + pay)
+MAX_OVERLAP_CHARS = 400
+# Bundan kısa eşleşmeler tesadüf sayılır, örtüşme olarak atılmaz
+MIN_OVERLAP_CHARS = 20
+
+# Pasajlar arasındaki "\n\n" ayırıcısı için pasaj başına ayrılan pay
+SEPARATOR_TOKENS = 2
+
+
+# --------------------------------------------------
+# TOKEN SAYIMI
+# --------------------------------------------------
+class TokenCounter:
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+        # HF fast tokenizer'lar aynı nesne üzerinde eşzamanlı çağrıda hata verebiliyor;
+        # tokenizer sayaca özeldir (make_token_counter), kilit yalnızca sayım thread'lerini sıralar
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return max(1, round(len(text) / CHARS_PER_TOKEN))
+        with self._lock:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+def make_token_counter(fallback_tokenizer=None) -> TokenCounter:
+    if CONTEXT_TOKENIZER:
+        try:
+            from transformers import AutoTokenizer
+
+            return TokenCounter(AutoTokenizer.from_pretrained(CONTEXT_TOKENIZER))
+        except Exception as e:
+            print(f"Tokenizer yüklenemedi ({CONTEXT_TOKENIZER}), yedek kullanılacak: {e}")
+    # Embedding tokenizer'ı encode sırasında kilitsiz kullanılır ve truncation / padding
+    # durumunu değiştirir; sayaç kendi kopyasıyla çalışır
+    return TokenCounter(copy.deepcopy(fallback_tokenizer) if fallback_tokenizer is not None else None)
+
+
+# --------------------------------------------------
+# KOMŞU CHUNK BİRLEŞTİRME
+# --------------------------------------------------
+def merge_overlap(left: str, right: str) -> str:
+    # left'in sonu ile right'ın başındaki ortak metin bir kez yazılır
+    longest = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def merge_neighbours(chunks: list) -> list:
+    # Aynı dokümanda ardışık chunk_id'li parçalar tek pasaja birleştirilir.
+    # Dönen her grup: chunk listesi (doküman sırasında)
+    ordered = sorted(chunks, key=lambda c: (c["doc_id"], c["chunk_id"]))
+    groups = []
+    for chunk in ordered:
+        last = groups[-1][-1] if groups else None
+        if last and last["doc_id"] == chunk["doc_id"] and last["chunk_id"] + 1 == chunk["chunk_id"]:
+            groups[-1].append(chunk)
+        else:
+            groups.append([chunk])
+    return groups
+
+
+def group_text(group: list) -> str:
+    text = group[0]["text"]
+    for chunk in group[1:]:
+        text = merge_overlap(text, chunk["text"])
+    return text
+
+
+# --------------------------------------------------
+# BÜTÇEYE GÖRE PAKETLEME
+# --------------------------------------------------
+def _knapsack(weights: list, values: list, budget: int) -> list:
+    # Birebir 0/1 sırt çantası; seçilen öğe indeksleri. Durumlar (ağırlık, değer)
+    # Pareto sınırında tutulur: daha ağır ama daha değersiz durumlar atılır,
+    # böylece onlarca öğede bile durum sayısı küçük kalır
+    states = [(0, 0.0, ())]
+    for i, (w, v) in enumerate(zip(weights, values)):
+        grown = [(sw + w, sv + v, chosen + (i,)) for sw, sv, chosen in states if sw + w <= budget]
+        merged = sorted(states + grown, key=lambda s: (s[0], -s[1]))
+
+        states = []
+        for state in merged:
+            if not states or state[1] > states[-1][1]:
+                states.append(state)
+
+    return list(max(states, key=lambda s: s[1])[2])
+
+
+def pack_context(selected: list, budget_tokens: int, count_tokens) -> tuple:
+    # selected: alaka sırasındaki chunk'lar (ilk en alakalı).
+    # Komşular birleştirilir, örtüşme atılır; pasajlar token bütçesine en yüksek toplam
+    # alaka ile sığacak şekilde seçilir. Dönüş: (bağlam metni, kullanılan chunk'lar)
+    rank = {(c["doc_id"], c["chunk_id"]): r for r, c in enumerate(selected)}
+
+    items = []
+    for group in merge_neighbours(selected):
+        text = group_text(group)
+        tokens = count_tokens(text)
+        if tokens > budget_tokens and len(group) > 1:
+            # Birleşik pasaj bütçeye sığmıyorsa parçaları ayrı ayrı değerlendirilir
+            for chunk in group:
+                items.append(([chunk], chunk["text"], count_tokens(chunk["text"])))
+        else:
+            items.append((group, text, tokens))
+
+    items = [item for item in items if item[2] <= budget_tokens]
+    if not items:
+        return "", []
+
+    # Alaka değeri sıraya göre azalır (1, 1/2, 1/3, ...); pasaj değeri üyelerinin toplamı
+    values = [sum(1.0 / (rank[(c["doc_id"], c["chunk_id"])] + 1) for c in group) for group, _, _ in items]
+    weights = [tokens + SEPARATOR_TOKENS for _, _, tokens in items]
+    chosen = _knapsack(weights, values, budget_tokens + SEPARATOR_TOKENS)
+
+    # Bağlamda en alakalı pasaj önce gelir
+    chosen.sort(key=lambda i: min(rank[(c["doc_id"], c["chunk_id"])] for c in items[i][0]))
+    context = "\n\n".join(items[i][1] for i in chosen)
+    used = [c for i in chosen for c in items[i][0]]
+    return context, used
@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# torch / sentence_transformers / onnxruntime yalnızca seçilen backend açılırken import edilir
+
+# Embedding backend: torch (SentenceTransformer) | onnx (ONNX Runtime, CPU)
+EMBED_BACKENDS = ("torch", "onnx")
+EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", "torch")
+# Dışa aktarılan ONNX grafikleri model başına burada tutulur (ilk açılışta bir kez üretilir)
+ONNX_DIR = os.getenv("RAG_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "rag-onnx"))
+# Dinamik int8 quantization (ağırlıklar int8, aktivasyonlar çalışma anında ölçeklenir)
+ONNX_QUANTIZE = os.getenv("RAG_ONNX_QUANTIZE", "1") == "1"
+# ONNX Runtime operatör içi thread sayısı
+ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", str(os.cpu_count() or 1)))
+
+ENCODE_BATCH_SIZE = 32
+
+
+# --------------------------------------------------
+# TORCH (SentenceTransformer)
+# --------------------------------------------------
+class TorchEncoder:
+    def __init__(self, model_name: str, device: str = "cpu"):
+        self.model_name = model_name
+        self.name = f"torch ({device})"
+        # Embedding cache anahtarı; torch vektörleri eski cache kayıtlarıyla uyumlu
+        self.cache_key = model_name
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+        self.tokenizer = getattr(self.model, "tokenizer", None)
+
+    def encode(self, texts: list, batch_size: int = ENCODE_BATCH_SIZE):
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype("float32")
+
+
+# --------------------------------------------------
+# ONNX RUNTIME (CPU, isteğe bağlı int8)
+# --------------------------------------------------
+def _onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, re.sub(r"[^\w.-]", "_", model_name))
+
+
+def export_onnx(model_name: str, quantize: bool = ONNX_QUANTIZE) -> str:
+    # Transformer gövdesi ONNX'e aktarılır; pooling + normalize numpy'da yapılır.
+    # Dosyalar geçici adla yazılıp yerine taşınır, yarım kalan export kullanılmaz.
+    model_dir = _onnx_model_dir(model_name)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    config_path = os.path.join(model_dir, "encoder.json")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target) and os.path.exists(config_path):
+        return target
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"ONNX grafiği dışa aktarılıyor: {model_name} -> {model_dir}")
+    os.makedirs(model_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+
+    extra = [type(m).__name__ for m in list(st)[2:] if type(m).__name__ != "Normalize"]
+    if extra:
+        raise RuntimeError(f"ONNX backend bu model yapısını desteklemiyor (ek katmanlar: {', '.join(extra)})")
+    # Eski sentence-transformers sürümleri pooling'i bayraklarla, yenileri adla verir
+    pool_config = st[1].get_config_dict()
+    pooling = pool_config.get("pooling_mode") or (
+        "cls" if pool_config.get("pooling_mode_cls_token")
+        else "mean" if pool_config.get("pooling_mode_mean_tokens")
+        else None
+    )
+    if pooling not in ("mean", "cls"):
+        raise RuntimeError(f"ONNX backend bu pooling tipini desteklemiyor: {pooling}")
+
+    class _Body(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            out = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+            return out.last_hidden_state
+
+    sample = st.tokenizer(["ısınma metni", "ikinci ısınma metni"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {0: "batch", 1: "seq"}
+
+    if not os.path.exists(fp32_path):
+        tmp_path = f"{fp32_path}.tmp-{os.getpid()}"
+        with torch.no_grad():
+            torch.onnx.export(
+                _Body(st[0].auto_model.eval()),
+                tuple(sample[n] for n in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={**{n: axes for n in input_names}, "last_hidden_state": axes},
+                opset_version=14,
+                do_constant_folding=True,
+            )
+        os.replace(tmp_path, fp32_path)
+
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = f"{int8_path}.tmp-{os.getpid()}.onnx"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+
+    st.tokenizer.save_pretrained(model_dir)
+    config = {
+        "model": model_name,
+        "pooling": pooling,
+        "max_seq_length": int(st.max_seq_length),
+        "dim": int(getattr(st, "get_embedding_dimension", st.get_sentence_embedding_dimension)()),
+        "inputs": input_names,
+    }
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return target
+
+
+class OnnxEncoder:
+    def __init__(self, model_name: str, quantize: bool = ONNX_QUANTIZE, threads: int = ONNX_THREADS):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("ONNX backend için onnxruntime kurulu olmalı (pip install onnxruntime).")
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        variant = "onnx-int8" if quantize else "onnx"
+        self.name = f"{variant} ({threads} thread)"
+        # int8 vektörleri torch'tan biraz farklı; cache'te karışmasınlar
+        self.cache_key = f"{model_name}#{variant}"
+
+        model_path = export_onnx(model_name, quantize)
+        model_dir = os.path.dirname(model_path)
+        with open(os.path.join(model_dir, "encoder.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling = config["pooling"]
+        self.max_seq_length = config["max_seq_length"]
+        self.dim = config["dim"]
+        self.input_names = config["inputs"]
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        # HF fast tokenizer'lar aynı nesne üzerinde eşzamanlı çağrıda hata verebiliyor. Bu nesneyi
+        # yalnızca encode kullanır: token sayacı (context_packer) tokenizer'ın kendi kopyasını alır
+        self._tokenizer_lock = threading.Lock()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, texts: list, batch_size: int = ENCODE_BATCH_SIZE):
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        # Uzunluğa göre sıralanır: batch içi padding (boşa hesap) azalır
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+        for i in range(0, len(order), max(1, batch_size)):
+            idx = order[i : i + batch_size]
+            with self._tokenizer_lock:
+                enc = self.tokenizer(
+                    [texts[j] for j in idx],
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_seq_length,
+                    return_tensors="np",
+                )
+            hidden = self.session.run(None, {n: enc[n].astype(np.int64) for n in self.input_names})[0]
+
+            if self.pooling == "cls":
+                vecs = hidden[:, 0]
+            else:
+                mask = enc["attention_mask"][:, :, None].astype(np.float32)
+                vecs = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            out[idx] = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def open_encoder(model_name: str, device: str = "cpu", backend: str = EMBED_BACKEND):
+    if backend == "torch":
+        return TorchEncoder(model_name, device)
+    if backend == "onnx":
+        return OnnxEncoder(model_name)
+    raise RuntimeError(f"Bilinmeyen embedding backend: {backend} (seçenekler: {', '.join(EMBED_BACKENDS)})")
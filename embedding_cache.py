@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Boşsa cache kapalı
+EMBED_CACHE_DIR = os.getenv("RAG_EMBED_CACHE_DIR", "")
+EMBED_CACHE_MAX_MB = float(os.getenv("RAG_EMBED_CACHE_MAX_MB", "512"))
+
+# SQLite "IN (...)" parametre sınırının altında kalmak için
+_QUERY_BATCH = 500
+
+
+# --------------------------------------------------
+# EMBEDDING CACHE (içerik adresli, disk, LRU)
+# --------------------------------------------------
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, max_bytes: int):
+        os.makedirs(path, exist_ok=True)
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(path, "embeddings.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vec BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> bytes:
+        # Anahtar: (model adı, chunk metni); model değişince eski vektörler kullanılmaz
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: list) -> list:
+        keys = [self._key(t) for t in texts]
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            for i in range(0, len(keys), _QUERY_BATCH):
+                part = keys[i : i + _QUERY_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    hit_marks = ",".join("?" * len(rows))
+                    self._db.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({hit_marks})",
+                        [now] + [k for k, _ in rows],
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return [
+            np.frombuffer(found[k], dtype="float32") if k in found else None
+            for k in keys
+        ]
+
+    def put_many(self, texts: list, vectors):
+        now = time.time()
+        rows = [
+            (self._key(t), np.ascontiguousarray(v, dtype="float32").tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for key, blob, used in rows:
+                    old = self._db.execute("SELECT nbytes FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, vec, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                        (key, blob, len(blob), used),
+                    )
+                    self._total += len(blob) - (old[0] if old else 0)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                self._total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+                raise
+
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # En uzun süredir kullanılmayanlardan başlayarak sınırın %90'ına inilir
+        target = int(self.max_bytes * 0.9)
+        while self._total > target:
+            rows = self._db.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total = 0
+                break
+
+            victims = []
+            for key, nbytes in rows:
+                if self._total <= target:
+                    break
+                victims.append(key)
+                self._total -= nbytes
+
+            marks = ",".join("?" * len(victims))
+            self._db.execute(f"DELETE FROM embeddings WHERE key IN ({marks})", victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "entries": count,
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def open_embedding_cache(model_name: str):
+    if not EMBED_CACHE_DIR:
+        return None
+    return EmbeddingCache(EMBED_CACHE_DIR, model_name, int(EMBED_CACHE_MAX_MB * 1024 * 1024))
@@ -0,0 +1,356 @@
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# BM25 parametreleri
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Satırların bu oranından (ve en az COMMON_TERM_MIN_DF satırda) geçen terimler, sorguda
+# daha seçici bir terim varsa atlanır: sıralamaya katkıları düşük, posting listeleri
+# ise en uzun olanlardır. Küçük korpuslarda devreye girmez.
+COMMON_TERM_RATIO = 0.1
+COMMON_TERM_MIN_DF = 10000
+
+# Ekler atıldıktan sonra kökte en az bu kadar harf kalmalı
+MIN_STEM = 4
+
+# Hafif Türkçe ek ayıklama: çoğul, hal ve ilgi ekleri (uzundan kısaya denenir)
+TR_SUFFIXES = sorted(
+    [
+        "lar", "ler", "ları", "leri", "larda", "lerde", "lardan", "lerden",
+        "lara", "lere", "ların", "lerin",
+        "da", "de", "ta", "te", "dan", "den", "tan", "ten",
+        "nda", "nde", "ndan", "nden",
+        "ın", "in", "un", "ün", "nın", "nin", "nun", "nün",
+        "yı", "yi", "yu", "yü", "ya", "ye",
+        "la", "le", "yla", "yle",
+        "sı", "si", "su", "sü",
+    ],
+    key=len,
+    reverse=True,
+)
+
+TR_STOPWORDS = {
+    "ve", "veya", "ile", "bir", "bu", "şu", "o", "da", "de", "mi", "mı", "mu", "mü",
+    "ne", "için", "gibi", "daha", "çok", "en", "ama", "ki", "her", "olan", "olarak",
+    "nedir", "nasıl", "hangi", "neden",
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# --------------------------------------------------
+# TÜRKÇE NORMALİZASYON
+# --------------------------------------------------
+def casefold_tr(text: str) -> str:
+    # str.lower() "I"yı "i"ye, "İ"yi "i̇"ye çevirir; Türkçede doğrusu ı / i
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def stem_tr(token: str) -> str:
+    # Sayı / kod içeren token'lar (madde no, tarih, ürün kodu) olduğu gibi kalır
+    if any(ch.isdigit() for ch in token):
+        return token
+
+    for _ in range(2):
+        for suffix in TR_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+                token = token[: -len(suffix)]
+                break
+        else:
+            break
+    return token
+
+
+def analyze(text: str) -> list:
+    return [
+        stem_tr(tok)
+        for tok in _TOKEN_RE.findall(casefold_tr(text))
+        if len(tok) > 1 and tok not in TR_STOPWORDS
+    ]
+
+
+# --------------------------------------------------
+# BM25 TERS İNDEKS
+# --------------------------------------------------
+class LexicalIndex:
+    # Satır numaraları FAISS ID'leri / chunks sırası ile aynıdır.
+    # Posting listeleri array modülüyle tutulur (satır: int32, tf: uint16);
+    # terim başına Python nesnesi yerine iki sıkışık tampon düşer.
+    # Silinen satırlar sıkıştırmaya kadar df/N istatistiklerinde kalır, aramada elenir.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings = {}
+        self.doc_len = array("I")
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, start: int, texts: list):
+        analyzed = [Counter(analyze(t)) for t in texts]
+
+        with self._lock:
+            if start != len(self.doc_len):
+                raise RuntimeError("Sözcük indeksi satırları vektör indeksiyle hizalı değil.")
+
+            for row, counts in enumerate(analyzed, start):
+                for term, tf in counts.items():
+                    entry = self.postings.get(term)
+                    if entry is None:
+                        entry = self.postings[term] = (array("i"), array("H"))
+                    entry[0].append(row)
+                    entry[1].append(min(tf, 65535))
+
+                length = sum(counts.values())
+                self.doc_len.append(length)
+                self.total_len += length
+
+    def _gather(self, terms):
+        # Kilit altında çağrılır; array tamponlarına bakan numpy görünümleri burada
+        # kalır, dışarıya yalnızca kopyalar döner (aksi halde add() tamponu büyütemez)
+        n = len(self.doc_len)
+        avgdl = self.total_len / n
+        lengths = np.frombuffer(self.doc_len, dtype=np.uint32)
+
+        entries = [self.postings[t] for t in terms if t in self.postings]
+        selective = [
+            e for e in entries if len(e[0]) <= max(COMMON_TERM_RATIO * n, COMMON_TERM_MIN_DF)
+        ]
+        if selective:
+            entries = selective
+
+        rows_parts, score_parts = [], []
+        for entry in entries:
+            rows = np.frombuffer(entry[0], dtype=np.int32)
+            tf = np.frombuffer(entry[1], dtype=np.uint16).astype(np.float32)
+            df = len(rows)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avgdl)
+
+            rows_parts.append(rows.astype(np.int64))
+            score_parts.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        return rows_parts, score_parts
+
+    def search(self, query: str, k: int, ranges: list | None = None, alive=None):
+        # (satırlar, skorlar) azalan skor sırasında; ranges verilirse yalnızca
+        # bu [(başlangıç, bitiş)) aralıklarındaki satırlar döner
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        terms = list(dict.fromkeys(analyze(query)))
+        if not terms or k <= 0:
+            return empty
+
+        with self._lock:
+            if not len(self.doc_len):
+                return empty
+            rows_parts, score_parts = self._gather(terms)
+
+        if not rows_parts:
+            return empty
+
+        rows = np.concatenate(rows_parts)
+        scores = np.concatenate(score_parts)
+
+        keep = np.ones(len(rows), dtype=bool)
+        if alive is not None:
+            keep &= alive[rows]
+        if ranges:
+            in_range = np.zeros(len(rows), dtype=bool)
+            for start, end in ranges:
+                in_range |= (rows >= start) & (rows < end)
+            keep &= in_range
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) == 0:
+            return empty
+
+        if len(rows) * 16 >= int(rows.max()) + 1:
+            # Sık terimlerde posting sayısı satır sayısına yaklaşır; sıralamak yerine
+            # satır uzunluğunda yoğun dizide toplamak daha ucuz
+            dense = np.bincount(rows, weights=scores)
+            uniq = np.flatnonzero(dense)
+            totals = dense[uniq]
+        else:
+            uniq, inverse = np.unique(rows, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+
+        if k < len(uniq):
+            top = np.argpartition(-totals, k - 1)[:k]
+        else:
+            top = np.arange(len(uniq))
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return uniq[top], totals[top].astype(np.float32)
+
+    def copy(self):
+        # Bağımsız kopya: yayınlanmış indeks hiç değişmez, yazar kopyaya ekler.
+        # Bellek eşlemeli (salt-okunur) indeksten de yazılabilir kopya çıkar
+        out = LexicalIndex()
+        with self._lock:
+            for term, (rows, tfs) in self.postings.items():
+                term_rows, term_tf = array("i"), array("H")
+                term_rows.frombytes(rows.tobytes())
+                term_tf.frombytes(tfs.tobytes())
+                out.postings[term] = (term_rows, term_tf)
+            out.doc_len.frombytes(self.doc_len.tobytes())
+            out.total_len = self.total_len
+        return out
+
+    def compacted(self, alive):
+        # Silinen satırlar atılır, kalanlar sıkıştırılmış satır numaralarına taşınır
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        out = LexicalIndex()
+
+        with self._lock:
+            for term, (rows_arr, tf_arr) in self.postings.items():
+                rows = np.frombuffer(rows_arr, dtype=np.int32)
+                keep = alive[rows]
+                if not keep.any():
+                    continue
+                new_rows, new_tf = array("i"), array("H")
+                new_rows.frombytes(remap[rows[keep]].astype(np.int32).tobytes())
+                new_tf.frombytes(np.frombuffer(tf_arr, dtype=np.uint16)[keep].tobytes())
+                out.postings[term] = (new_rows, new_tf)
+
+            lengths = np.frombuffer(self.doc_len, dtype=np.uint32)[alive]
+            out.doc_len.frombytes(lengths.tobytes())
+            out.total_len = int(lengths.sum())
+        return out
+
+    # --------------------------------------------------
+    # DISK
+    # --------------------------------------------------
+    def save(self, path: str):
+        # Dizin: terimler sıralı (mmap'te ikili arama için), posting'ler tek dizide art arda
+        with self._lock:
+            terms = sorted(self.postings)
+            sizes = [len(self.postings[t][0]) for t in terms]
+            rows = np.concatenate(
+                [np.frombuffer(self.postings[t][0], dtype=np.int32) for t in terms]
+            ) if terms else np.empty(0, dtype=np.int32)
+            tfs = np.concatenate(
+                [np.frombuffer(self.postings[t][1], dtype=np.uint16) for t in terms]
+            ) if terms else np.empty(0, dtype=np.uint16)
+            doc_len = np.frombuffer(self.doc_len, dtype=np.uint32).copy()
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "terms.npy"), np.array(terms, dtype=str))
+        np.save(os.path.join(path, "offsets.npy"), np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]))
+        np.save(os.path.join(path, "rows.npy"), rows)
+        np.save(os.path.join(path, "tfs.npy"), tfs)
+        np.save(os.path.join(path, "doc_len.npy"), doc_len)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False):
+        # mmap=True: posting'ler dosyadan salt-okunur eşlenir (process'ler arası paylaşılır);
+        # böyle açılan indekse add() yapılamaz
+        if path.endswith(".npz"):
+            return cls._load_npz(path)
+
+        out = cls()
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("terms", "offsets", "rows", "tfs", "doc_len")
+        }
+        postings = MappedPostings(arrays["terms"], arrays["offsets"], arrays["rows"], arrays["tfs"])
+        out.total_len = int(arrays["doc_len"].sum())
+        if mmap:
+            out.postings = postings
+            out.doc_len = arrays["doc_len"]
+            return out
+
+        for term, (rows, tfs) in postings.items():
+            term_rows, term_tf = array("i"), array("H")
+            term_rows.frombytes(rows.tobytes())
+            term_tf.frombytes(tfs.tobytes())
+            out.postings[term] = (term_rows, term_tf)
+        out.doc_len.frombytes(arrays["doc_len"].tobytes())
+        return out
+
+    @classmethod
+    def _load_npz(cls, path: str):
+        # v2 snapshot biçimi
+        out = cls()
+        with np.load(path) as data:
+            rows, tfs = data["rows"], data["tfs"]
+            offset = 0
+            for term, size in zip(data["terms"].tolist(), data["sizes"].tolist()):
+                term_rows, term_tf = array("i"), array("H")
+                term_rows.frombytes(rows[offset : offset + size].tobytes())
+                term_tf.frombytes(tfs[offset : offset + size].tobytes())
+                out.postings[term] = (term_rows, term_tf)
+                offset += size
+            out.doc_len.frombytes(data["doc_len"].astype(np.uint32).tobytes())
+            out.total_len = int(data["doc_len"].sum())
+        return out
+
+    @classmethod
+    def from_texts(cls, texts: list):
+        out = cls()
+        out.add(0, texts)
+        return out
+
+
+class MappedPostings:
+    # postings dict'inin salt-okunur, bellek eşlemeli karşılığı: terim -> (satırlar, tf)
+    def __init__(self, terms, offsets, rows, tfs):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _find(self, term: str):
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return None
+
+    def _entry(self, i: int):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.rows[start:end], self.tfs[start:end]
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __getitem__(self, term):
+        i = self._find(term)
+        if i is None:
+            raise KeyError(term)
+        return self._entry(i)
+
+    def get(self, term, default=None):
+        i = self._find(term)
+        return default if i is None else self._entry(i)
+
+    def __iter__(self):
+        return (str(t) for t in self.terms)
+
+    def items(self):
+        return ((str(t), self._entry(i)) for i, t in enumerate(self.terms))
+
+
+# --------------------------------------------------
+# SKOR FÜZYONU
+# --------------------------------------------------
+def rrf_fuse(rankings: list, k: int, rrf_k: int = 60):
+    # Reciprocal Rank Fusion: skor ölçekleri farklı sıralamaları yalnızca
+    # sıra üzerinden birleştirir. Dönen skorlar en iyi aday 1.0 olacak şekilde ölçeklenir.
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            row = int(row)
+            fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    ordered = sorted(fused, key=lambda r: -fused[r])[:k]
+    scores = np.array([fused[r] for r in ordered], dtype=np.float64)
+    if len(scores):
+        scores /= scores[0]
+    return ordered, scores
@@ -0,0 +1,519 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Counter, Histogram
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+HF_URL = "https://router.huggingface.co/v1/chat/completions"
+HF_MODELS = os.getenv(
+    "HF_MODELS",
+    "Qwen/Qwen2.5-7B-Instruct:hf-inference,HuggingFaceH4/zephyr-7b-beta:hf-inference",
+)
+HF_MODEL = os.getenv("HF_MODEL", HF_MODELS.split(",")[0].strip())
+
+# Aynı host'a açık tutulacak keep-alive bağlantı sayısı (eşzamanlı istek sayısı kadar)
+HF_POOL_SIZE = int(os.getenv("HF_POOL_SIZE", "16"))
+HF_CONNECT_TIMEOUT = float(os.getenv("HF_CONNECT_TIMEOUT", "10"))
+HF_READ_TIMEOUT = float(os.getenv("HF_READ_TIMEOUT", "120"))
+
+# Üst üste bu kadar hata alan model HF_CIRCUIT_COOLDOWN saniye denenmez
+HF_CIRCUIT_FAILURES = int(os.getenv("HF_CIRCUIT_FAILURES", "3"))
+HF_CIRCUIT_COOLDOWN = float(os.getenv("HF_CIRCUIT_COOLDOWN", "30"))
+# Son HF_DEMOTE_SECONDS içinde hata veren model sıralamada sona alınır
+HF_DEMOTE_SECONDS = float(os.getenv("HF_DEMOTE_SECONDS", "60"))
+# Hedge: ilk model p95 süresinde cevap vermezse sıradaki model paralel denenir (yalnızca async)
+HF_HEDGE = os.getenv("HF_HEDGE", "0") == "1"
+HF_HEDGE_DELAY = float(os.getenv("HF_HEDGE_DELAY", "2.0"))
+HEDGE_MIN_SAMPLES = 10
+
+LLM_REQUESTS = Counter("rag_llm_requests_total", "Model başına LLM isteği (outcome: success | failure)", ("model", "outcome"))
+LLM_SECONDS = Histogram("rag_llm_seconds", "Başarılı LLM isteğinin toplam süresi (sn)", ("model",))
+LLM_TTFT_SECONDS = Histogram("rag_llm_ttft_seconds", "Stream isteğinde ilk token'a kadar geçen süre (sn)", ("model",))
+
+
+def resolve_models(primary: str, models: str) -> list:
+    env_models = [m.strip() for m in models.split(",") if m.strip()]
+    base_models = [primary] + env_models
+
+    # Preserve order, remove duplicates
+    seen = set()
+    models_to_try = []
+    for model in base_models:
+        if model and model not in seen:
+            seen.add(model)
+            models_to_try.append(model)
+
+    # Try both provider-qualified and bare model names when needed
+    expanded = []
+    for model in models_to_try:
+        expanded.append(model)
+        if ":" in model:
+            bare = model.split(":", 1)[0]
+            if bare not in expanded:
+                expanded.append(bare)
+    return expanded
+
+
+def _parse_stream_line(line: str):
+    # OpenAI uyumlu SSE akışı: "data: {json}" satırları, "data: [DONE]" ile biter.
+    # Dönüş: (akış bitti mi, token)
+    if not line or not line.startswith("data:"):
+        return False, None
+
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return True, None
+
+    obj = json.loads(data)
+    if obj.get("error"):
+        raise ValueError(f"akış hatası: {obj['error']}")
+
+    choices = obj.get("choices") or []
+    if not choices:
+        return False, None
+
+    return False, (choices[0].get("delta") or {}).get("content") or None
+
+
+def _iter_stream_tokens(lines):
+    for line in lines:
+        done, token = _parse_stream_line(line)
+        if done:
+            return
+        if token:
+            yield token
+
+
+# --------------------------------------------------
+# MODEL ROUTER (SAĞLIK TAKİBİ)
+# --------------------------------------------------
+class _ModelHealth:
+    def __init__(self):
+        self.latencies = deque(maxlen=100)
+        self.outcomes = deque(maxlen=100)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_failure_at = float("-inf")
+
+
+class ModelRouter:
+    def __init__(self, models: list):
+        self.models = list(models)
+        self._health = {m: _ModelHealth() for m in self.models}
+        self._lock = threading.Lock()
+
+    def order(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            closed = [m for m in self.models if self._health[m].open_until <= now]
+            if not closed:
+                # Hepsi devre dışıysa yine de en erken açılacak olandan başlayarak dene
+                return sorted(self.models, key=lambda m: self._health[m].open_until)
+            # Sıralama kararlı: yakın zamanda hata vermeyenler yapılandırma sırasıyla önde
+            return sorted(
+                closed,
+                key=lambda m: now - self._health[m].last_failure_at < HF_DEMOTE_SECONDS,
+            )
+
+    def record_success(self, model: str, latency: float | None = None):
+        LLM_REQUESTS.labels(model, "success").inc()
+        with self._lock:
+            h = self._health[model]
+            h.consecutive_failures = 0
+            h.open_until = 0.0
+            h.outcomes.append(True)
+            if latency is not None:
+                h.latencies.append(latency)
+
+    def record_failure(self, model: str):
+        LLM_REQUESTS.labels(model, "failure").inc()
+        now = time.monotonic()
+        with self._lock:
+            h = self._health[model]
+            h.consecutive_failures += 1
+            h.last_failure_at = now
+            h.outcomes.append(False)
+            if h.consecutive_failures >= HF_CIRCUIT_FAILURES:
+                h.open_until = now + HF_CIRCUIT_COOLDOWN
+
+    def hedge_delay(self, model: str) -> float:
+        with self._lock:
+            latencies = sorted(self._health[model].latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HF_HEDGE_DELAY
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for model, h in self._health.items():
+                latencies = sorted(h.latencies)
+                out[model] = {
+                    "requests": len(h.outcomes),
+                    "error_rate": (h.outcomes.count(False) / len(h.outcomes)) if h.outcomes else 0.0,
+                    "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+                    "circuit_open": h.open_until > now,
+                }
+        return out
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    # Sync ve async client aynı sağlık bilgisini paylaşır
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(resolve_models(HF_MODEL, HF_MODELS))
+    return _router
+
+
+class _ModelError(Exception):
+    # Tek modelin denemesi başarısız oldu; sıradaki modele geçilebilir
+    pass
+
+
+# --------------------------------------------------
+# LLM CLIENT (KEEP-ALIVE SESSION)
+# --------------------------------------------------
+class _BaseLLMClient:
+    def __init__(self, url: str, token: str | None, models: list | None, router: ModelRouter | None):
+        self.url = url
+        self.token = token
+        # Fallback listesi bir kez hesaplanır (router içinde)
+        self.router = router or (ModelRouter(models) if models else get_model_router())
+        self.models = self.router.models
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        }
+
+    def _check_token(self):
+        if not self.token:
+            raise RuntimeError("HF_TOKEN tanımlı değil. Ortam değişkeni olarak ayarlayın.")
+
+    def _payload(self, model_name: str, prompt: str, max_tokens: int, temperature: float, stream: bool):
+        return {
+            "model": model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    def _failed(self, last_error):
+        return RuntimeError(
+            "HuggingFace API isteği başarısız. "
+            f"Denenen modeller: {self.models}. Son hata: {last_error}"
+        )
+
+    def _parse_completion(self, data) -> str:
+        try:
+            return data["choices"][0]["message"]["content"].strip()
+        except Exception as e:
+            raise RuntimeError(f"HuggingFace API yanıt formatı beklenen yapıda değil: {data}") from e
+
+
+class LLMClient(_BaseLLMClient):
+    def __init__(
+        self,
+        url: str = HF_URL,
+        token: str | None = None,
+        models: list | None = None,
+        pool_size: int = HF_POOL_SIZE,
+        connect_timeout: float = HF_CONNECT_TIMEOUT,
+        read_timeout: float = HF_READ_TIMEOUT,
+        router: ModelRouter | None = None,
+    ):
+        super().__init__(url, token, models, router)
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if token:
+            self.session.headers.update(self._headers())
+
+    def _attempt(self, model_name: str, payload: dict) -> str:
+        start = time.monotonic()
+        try:
+            r = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.router.record_failure(model_name)
+            raise _ModelError(str(e)) from e
+
+        if r.status_code >= 400:
+            self.router.record_failure(model_name)
+            raise _ModelError(f"{r.status_code} {r.reason}: {r.text.strip()}")
+
+        latency = time.monotonic() - start
+        self.router.record_success(model_name, latency)
+        LLM_SECONDS.labels(model_name).observe(latency)
+
+        try:
+            data = r.json()
+        except ValueError as e:
+            raise RuntimeError("HuggingFace API geçersiz JSON döndürdü.") from e
+
+        return self._parse_completion(data)
+
+    def complete(self, prompt: str, max_tokens: int = 300, temperature: float = 0.2) -> str:
+        self._check_token()
+        last_error = None
+
+        for model_name in self.router.order():
+            try:
+                return self._attempt(
+                    model_name,
+                    self._payload(model_name, prompt, max_tokens, temperature, False),
+                )
+            except _ModelError as e:
+                last_error = str(e)
+
+        raise self._failed(last_error)
+
+    def stream(self, prompt: str, max_tokens: int = 300, temperature: float = 0.2):
+        self._check_token()
+        last_error = None
+
+        for model_name in self.router.order():
+            start = time.monotonic()
+            try:
+                r = self.session.post(
+                    self.url,
+                    json=self._payload(model_name, prompt, max_tokens, temperature, True),
+                    timeout=self.timeout,
+                    stream=True,
+                )
+            except requests.RequestException as e:
+                self.router.record_failure(model_name)
+                last_error = str(e)
+                continue
+
+            with r:
+                if r.status_code >= 400:
+                    self.router.record_failure(model_name)
+                    body = r.text.strip()
+                    last_error = f"{r.status_code} {r.reason}: {body}"
+                    continue
+
+                r.encoding = "utf-8"
+                emitted = False
+                try:
+                    for token in _iter_stream_tokens(r.iter_lines(decode_unicode=True)):
+                        if not emitted:
+                            self.router.record_success(model_name)
+                            LLM_TTFT_SECONDS.labels(model_name).observe(time.monotonic() - start)
+                        emitted = True
+                        yield token
+                except (requests.RequestException, ValueError) as e:
+                    self.router.record_failure(model_name)
+                    # İlk token gönderildikten sonra başka modele geçilemez; cevap karışır
+                    if emitted:
+                        raise RuntimeError(f"HuggingFace API akışı yarıda kesildi: {e}") from e
+                    last_error = str(e)
+                    continue
+
+                LLM_SECONDS.labels(model_name).observe(time.monotonic() - start)
+                return
+
+        raise self._failed(last_error)
+
+
+class AsyncLLMClient(_BaseLLMClient):
+    def __init__(
+        self,
+        url: str = HF_URL,
+        token: str | None = None,
+        models: list | None = None,
+        pool_size: int = HF_POOL_SIZE,
+        connect_timeout: float = HF_CONNECT_TIMEOUT,
+        read_timeout: float = HF_READ_TIMEOUT,
+        router: ModelRouter | None = None,
+        hedge: bool = HF_HEDGE,
+    ):
+        super().__init__(url, token, models, router)
+        self.hedge = hedge
+        self.client = httpx.AsyncClient(
+            headers=self._headers() if token else None,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _attempt(self, model_name: str, payload: dict) -> str:
+        start = time.monotonic()
+        try:
+            r = await self.client.post(self.url, json=payload)
+        except httpx.HTTPError as e:
+            self.router.record_failure(model_name)
+            raise _ModelError(str(e)) from e
+
+        if r.status_code >= 400:
+            self.router.record_failure(model_name)
+            raise _ModelError(f"{r.status_code} {r.reason_phrase}: {r.text.strip()}")
+
+        latency = time.monotonic() - start
+        self.router.record_success(model_name, latency)
+        LLM_SECONDS.labels(model_name).observe(latency)
+
+        try:
+            data = r.json()
+        except ValueError as e:
+            raise RuntimeError("HuggingFace API geçersiz JSON döndürdü.") from e
+
+        return self._parse_completion(data)
+
+    async def complete(self, prompt: str, max_tokens: int = 300, temperature: float = 0.2) -> str:
+        self._check_token()
+        last_error = None
+        queue = self.router.order()
+        running = {}
+
+        def launch():
+            model_name = queue.pop(0)
+            payload = self._payload(model_name, prompt, max_tokens, temperature, False)
+            running[asyncio.ensure_future(self._attempt(model_name, payload))] = model_name
+
+        launch()
+        try:
+            while running:
+                # Tek istek uçuştayken p95 süresi dolarsa sıradaki modeli de başlat (hedge)
+                timeout = None
+                if self.hedge and queue and len(running) == 1:
+                    timeout = self.router.hedge_delay(next(iter(running.values())))
+
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+
+                for task in done:
+                    running.pop(task)
+                    try:
+                        return task.result()
+                    except _ModelError as e:
+                        last_error = str(e)
+
+                if not running and queue:
+                    launch()
+        finally:
+            # Kazanan belli oldu (ya da hata): kalan istekler iptal edilir
+            for task in running:
+                task.cancel()
+
+        raise self._failed(last_error)
+
+    async def stream(self, prompt: str, max_tokens: int = 300, temperature: float = 0.2):
+        self._check_token()
+        last_error = None
+
+        for model_name in self.router.order():
+            emitted = False
+            start = time.monotonic()
+            try:
+                async with self.client.stream(
+                    "POST",
+                    self.url,
+                    json=self._payload(model_name, prompt, max_tokens, temperature, True),
+                ) as r:
+                    if r.status_code >= 400:
+                        self.router.record_failure(model_name)
+                        body = (await r.aread()).decode("utf-8", errors="replace").strip()
+                        last_error = f"{r.status_code} {r.reason_phrase}: {body}"
+                        continue
+
+                    async for line in r.aiter_lines():
+                        done, token = _parse_stream_line(line)
+                        if done:
+                            break
+                        if token:
+                            if not emitted:
+                                self.router.record_success(model_name)
+                                LLM_TTFT_SECONDS.labels(model_name).observe(time.monotonic() - start)
+                            emitted = True
+                            yield token
+            except (httpx.HTTPError, ValueError) as e:
+                self.router.record_failure(model_name)
+                # İlk token gönderildikten sonra başka modele geçilemez; cevap karışır
+                if emitted:
+                    raise RuntimeError(f"HuggingFace API akışı yarıda kesildi: {e}") from e
+                last_error = str(e)
+                continue
+
+            LLM_SECONDS.labels(model_name).observe(time.monotonic() - start)
+            return
+
+        raise self._failed(last_error)
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+
+def get_llm_client() -> LLMClient:
+    # HF_TOKEN import'ta değil çağrıda okunur (Streamlit secrets köprüsü sonradan ayarlayabilir)
+    global _client
+    token = os.getenv("HF_TOKEN")
+    if _client is None or _client.token != token:
+        with _client_lock:
+            if _client is None or _client.token != token:
+                _client = LLMClient(token=token)
+    return _client
+
+
+def call_llm(prompt: str, max_tokens: int = 300, temperature: float = 0.2) -> str:
+    return get_llm_client().complete(prompt, max_tokens=max_tokens, temperature=temperature)
+
+
+def stream_llm(prompt: str, max_tokens: int = 300, temperature: float = 0.2):
+    return get_llm_client().stream(prompt, max_tokens=max_tokens, temperature=temperature)
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    # httpx.AsyncClient tek event loop'a bağlıdır; sunucu loop'u içinde oluşturulur
+    global _async_client
+    token = os.getenv("HF_TOKEN")
+    if _async_client is None or _async_client.token != token:
+        old = _async_client
+        _async_client = AsyncLLMClient(token=token)
+        if old is not None:
+            asyncio.get_running_loop().create_task(old.aclose())
+    return _async_client
+
+
+async def aclose_llm_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def acall_llm(prompt: str, max_tokens: int = 300, temperature: float = 0.2) -> str:
+    return await get_async_llm_client().complete(prompt, max_tokens=max_tokens, temperature=temperature)
+
+
+def astream_llm(prompt: str, max_tokens: int = 300, temperature: float = 0.2):
+    return get_async_llm_client().stream(prompt, max_tokens=max_tokens, temperature=temperature)
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pypdf import PdfReader
+
+# Bu modül bilerek yalnızca pypdf import eder: process pool işçileri (spawn)
+# torch / sentence_transformers yüklemeden sayfa çıkarabilsin. fork kullanılmaz: sunucu
+# process'i çok thread'li (event loop, executor'lar, batcher, torch); fork anında başka
+# bir thread'in tuttuğu kilit çocukta sonsuza dek kilitli kalabilir.
+
+# Bu sayfa sayısından büyük PDF'ler process pool ile paralel okunur
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("RAG_PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_WORKERS = int(os.getenv("RAG_PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 8
+
+
+def _extract_page_range(args):
+    path, start, end = args
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def pdf_page_count(source) -> int:
+    try:
+        return len(PdfReader(source).pages)
+    except Exception as e:
+        raise RuntimeError(f"PDF okunurken hata oluştu: {e}")
+
+
+def iter_pdf_pages(source, workers: int | None = None):
+    # Sayfa metinlerini sırayla, çıkarıldıkça üretir.
+    # source bir dosya yolu ya da ikili dosya nesnesi olabilir; dosya nesneleri
+    # işçi process'lere aktarılamadığı için her zaman seri okunur.
+    try:
+        reader = PdfReader(source)
+        page_count = len(reader.pages)
+
+        if not isinstance(source, str):
+            workers = 1
+        elif workers is None:
+            workers = PDF_WORKERS if page_count >= PDF_PARALLEL_MIN_PAGES else 1
+
+        if workers <= 1:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+        tasks = iter(
+            (source, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        )
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Sınırlı pencere: işçiler tüketiciden en fazla 2*workers görev önde gider
+            pending = deque(pool.submit(_extract_page_range, t) for _, t in zip(range(workers * 2), tasks))
+            while pending:
+                texts = pending.popleft().result()
+                task = next(tasks, None)
+                if task is not None:
+                    pending.append(pool.submit(_extract_page_range, task))
+                yield from texts
+    except Exception as e:
+        raise RuntimeError(f"PDF okunurken hata oluştu: {e}")
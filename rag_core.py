@@ -1,25 +1,36 @@
+import asyncio
+import functools
+import hashlib
 import json
 import os
+import queue
 import re
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
 import faiss
 import numpy as np
-import requests
-import torch
-from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer
+
+from chunk_store import load_chunks, save_chunks
+from context_packer import make_token_counter, pack_context
+from embedding_backend import EMBED_BACKEND, open_encoder
+from embedding_cache import open_embedding_cache
+from lexical_index import LexicalIndex, analyze, rrf_fuse
+from reranker import open_reranker
+from llm_client import HF_MODEL, HF_URL, acall_llm, astream_llm, call_llm, stream_llm
+from metrics import Counter, Gauge, Histogram
+from pdf_extract import iter_pdf_pages, pdf_page_count
+from shared_index import SHARED_INDEX_DIR, SHARED_POLL_S, open_shared_index
 
 # --------------------------------------------------
 # CONFIG
 # --------------------------------------------------
-HF_URL = "https://router.huggingface.co/v1/chat/completions"
-HF_MODELS = os.getenv(
-    "HF_MODELS",
-    "Qwen/Qwen2.5-7B-Instruct:hf-inference,HuggingFaceH4/zephyr-7b-beta:hf-inference",
-)
-HF_MODEL = os.getenv("HF_MODEL", HF_MODELS.split(",")[0].strip())
-HF_TOKEN = os.getenv("HF_TOKEN")
-
 SUMMARY_KEYWORDS = [
     "ana konu",
     "özet",
@@ -30,177 +41,1005 @@ SUMMARY_KEYWORDS = [
     "genel olarak",
 ]
 
-MAX_CONTEXT_CHARS = 2000
-MAX_SUMMARY_CONTEXT_CHARS = 3200
+# Bağlam bütçeleri tokenizer token'ı cinsinden (eskiden 2000 / 3200 karakter)
+MAX_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_CONTEXT_TOKENS", "600"))
+MAX_SUMMARY_CONTEXT_TOKENS = int(os.getenv("RAG_MAX_SUMMARY_CONTEXT_TOKENS", "900"))
+SUMMARY_TOKENS_PER_CHUNK = 250
+MAX_SUMMARY_TOKENS_CAP = 3400
 MAX_TOKENS_QA = 300
 MAX_TOKENS_SUMMARY = 700
-REQUEST_TIMEOUT = 120
+
+# Özet soruları doküman başına bir kez çıkarılıp önbelleğe alınan hiyerarşik
+# özetten (bölüm özetleri -> genel özet) cevaplanır; doküman değişince geçersizleşir
+SUMMARY_CACHE = os.getenv("RAG_SUMMARY_CACHE", "1") == "1"
+SUMMARY_SECTION_TOKENS = 1200
+SUMMARY_MAX_SECTIONS = 12
+# Bundan fazla doküman kapsayan özet soruları eski (retrieval) yoldan cevaplanır
+SUMMARY_MAX_DOCS = 4
+SUMMARY_MAP_CONCURRENCY = 4
+# Bir istek içinde en fazla bu kadar eksik özet ağacı çıkarılır (~13 LLM çağrısı / doküman);
+# daha fazlası eksikse ağaçlar arka planda çıkarılır, soru retrieval yolundan cevaplanır
+SUMMARY_INLINE_BUILDS = 1
+MAX_TOKENS_SECTION = 160
+
+# Özet sorusunda bunların dışında bir kelime yoksa soru "genel özet" sayılır; yalnızca
+# genel özet soruları önbellekten cevaplanır, belirli bir şey sorular retrieval'a gider
+GENERIC_SUMMARY_TERMS = set(
+    analyze(
+        " ".join(SUMMARY_KEYWORDS)
+        + " doküman dokümanın belge belgenin metin metnin pdf dosya dosyanın kitap kitabın"
+        + " rapor raporun özetle özetler özetini anlat anlatır anlatıyor kısaca hakkında"
+        + " bahsediyor bahsetmektedir konusu konusunu nedir neler neyi özeti özetin tamamını tümü"
+        + " tümünü bütün metni içerik içeriği içeriğini misin musun mısın müsün ver verir verebilir"
+    )
+)
+
+# Async yolda embedding / FAISS / PDF işleri bu kadar thread'e sınırlanır
+CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Eşzamanlı soruların embedding'i tek forward pass'te toplanır (1 = kapalı)
+EMBED_BATCH_MAX = int(os.getenv("RAG_EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("RAG_EMBED_BATCH_WAIT_MS", "5"))
+
+# Ingest sırasında chunk'lar bu boyutta gruplar halinde embed edilir
+INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "64"))
+# Chunk sınırları (bkz. iter_chunks): gövde en az ¾ doluyken son CHUNK_HASH_WORDS
+# kelimenin özeti cümle sonlarında 1/CHUNK_CUT_MODULUS, diğer kelimelerde
+# 1/CHUNK_WORD_CUT_MODULUS olasılıkla kesme noktası sayılır
+CHUNK_HASH_WORDS = 3
+CHUNK_CUT_MODULUS = 4
+CHUNK_WORD_CUT_MODULUS = 16
+SENTENCE_END = (".", "!", "?", "…", ":", ";")
+
+# Toplu sorularda (ask_many) sorular bu boyutta bloklar halinde tek encode / tek FAISS
+# araması / tek MMR turundan geçer; ilk blok biter bitmez LLM çağrıları başlar
+ASK_BATCH_BLOCK = int(os.getenv("RAG_ASK_BATCH_BLOCK", "64"))
+# Toplu sorularda aynı anda bekleyen en fazla LLM çağrısı
+ASK_BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_ASK_BATCH_LLM_CONCURRENCY", "8"))
+
+# Disk snapshot formatı; yapı değişirse artırılır.
+# v2: indeks ID eşlemeli (ID = satır no) ve silinen satırlar alive.npy ile işaretli
+# v3: chunk'lar ve sözcük indeksi bellek eşlenebilir dizinlerde (chunks/, lexical/), docs.json
+SNAPSHOT_FORMAT_VERSION = 3
+
+# FAISS indeks tipi: flat (birebir) | hnsw | ivf | ivfpq (yaklaşık)
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 8
+# IVF/PQ bu kadar vektör birikmeden eğitilmez; o zamana kadar flat indeks kullanılır
+IVF_MIN_TRAIN = int(os.getenv("RAG_IVF_MIN_TRAIN", "2048"))
+# 8-bit PQ kod kitabı için en az 2^8 eğitim vektörü gerekir
+PQ_MIN_TRAIN = 256
+
+# Vektör depolama: float32 (indeks + ayrı embedding kopyası) | float16 | int8.
+# Sıkıştırılmış modlarda tek kopya vektörler FAISS scalar quantizer indeksinde
+# tutulur; MMR / doküman içi arama vektörleri oradan çözer (4 byte yerine 2 / 1 byte)
+VECTOR_STORAGES = ("float32", "float16", "int8")
+VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "float32")
+# int8 boyut başına min/max aralığı bu kadar vektörle öğrenilir; o zamana kadar float16
+SQ_MIN_TRAIN = 1024
+# Öğrenilen aralık her iki yönde bu oranda genişletilir (sonradan gelen vektörler kırpılmasın)
+SQ_RANGE_MARGIN = 0.2
+
+# Yoğun (FAISS) aramaya ek olarak BM25 sözcük araması yapılıp RRF ile birleştirilir
+LEXICAL_SEARCH = os.getenv("RAG_LEXICAL", "1") == "1"
+RRF_K = 60
+
+# Rerank çalıştığında LLM'e gönderilen en fazla chunk (ilk aşamadan daha isabetli
+# olduğu için daha az chunk yeterli)
+RERANK_TOP_K = int(os.getenv("RAG_RERANK_TOP_K", "4"))
+
+# Silinmiş (tombstone) satır oranı bunu aşınca arka planda sıkıştırma yapılır
+COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "0.2"))
+# Eğitilen indeksler (IVF listeleri, PQ / int8 kod kitapları) eğitildikleri canlı satır sayısının
+# bu katına ulaşınca sıkıştırmayla birlikte yeniden eğitilir (nlist de korpusla büyür)
+INDEX_RETRAIN_FACTOR = float(os.getenv("RAG_INDEX_RETRAIN_FACTOR", "8"))
+
+
+# --------------------------------------------------
+# METRİKLER (/metrics)
+# --------------------------------------------------
+QUERY_EMBED_SECONDS = Histogram("rag_query_embed_seconds", "Sorgu embedding süresi (sn; toplu soruda blok başına)")
+SEARCH_SECONDS = Histogram("rag_search_seconds", "Yoğun (FAISS / doküman filtreli) arama süresi (sn)")
+MMR_SECONDS = Histogram("rag_mmr_seconds", "MMR çeşitlilik seçimi süresi (sn)")
+PROMPT_BUILD_SECONDS = Histogram("rag_prompt_build_seconds", "Seçilen chunk'ların token bütçesine paketlenmesi (sn)")
+INGEST_PAGES = Counter("rag_ingest_pages_total", "Ingest sırasında okunan PDF sayfası")
+INGEST_CHUNKS = Counter("rag_ingest_chunks_total", "Ingest sırasında embed edilen chunk")
+INGEST_SECONDS = Counter("rag_ingest_seconds_total", "PDF okuma + embedding için harcanan toplam süre (sn)")
+CHUNKS_GAUGE = Gauge("rag_chunks", "İndeksteki canlı chunk sayısı")
+INDEX_BYTES_GAUGE = Gauge("rag_index_bytes", "FAISS indeksinin yaklaşık bellek boyutu (bayt)")
 
 
 # --------------------------------------------------
 # PDF OKUMA
 # --------------------------------------------------
 def read_pdf(path: str) -> str:
-    try:
-        reader = PdfReader(path)
-        text = ""
-        for page in reader.pages:
-            content = page.extract_text()
-            if content:
-                text += content + "\n"
-        return text.strip()
-    except Exception as e:
-        raise RuntimeError(f"PDF okunurken hata oluştu: {e}")
+    return "".join(content + "\n" for content in iter_pdf_pages(path) if content).strip()
 
 
 # --------------------------------------------------
 # CHUNKING
 # --------------------------------------------------
-def chunk_text(text: str, doc_id: str, chunk_size: int = 800, overlap: int = 150):
-    chunks = []
-    start = 0
+def _iter_words(pages, limit: int):
+    # Boşluklar normalize edilir: satır kırılımı / sayfa düzeni değişse de aynı metin aynı
+    # kelimeleri verir. limit'ten uzun "kelime" (boşluksuz metin) parçalanır
+    for content in pages:
+        for word in (content or "").split():
+            while len(word) > limit:
+                yield word[:limit]
+                word = word[limit:]
+            yield word
+
+
+def _is_cut_point(window) -> bool:
+    # Son CHUNK_HASH_WORDS kelimenin crc32'si; cümle sonlarında kesme olasılığı daha yüksek
+    modulus = CHUNK_CUT_MODULUS if window[-1].endswith(SENTENCE_END) else CHUNK_WORD_CUT_MODULUS
+    return zlib.crc32(" ".join(window).encode("utf-8")) % modulus == 0
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    # Sonraki chunk'ın başına eklenecek örtüşme, kelime sınırından başlar
+    if overlap <= 0:
+        return ""
+    if len(text) <= overlap:
+        return text
+    tail = text[-overlap:]
+    cut = tail.find(" ")
+    return tail[cut + 1 :] if cut >= 0 else tail
+
+
+def iter_chunks(pages, doc_id: str, chunk_size: int = 800, overlap: int = 150):
+    # İçerikle belirlenen sınırlar (content-defined chunking): gövde en az ¾ doluysa,
+    # son birkaç kelimenin özeti kesme koşulunu sağladığında orada kesilir; uzunluk sınırında
+    # zorla kesilir. Sınır konumdan değil içerikten geldiği için dokümanın başındaki bir
+    # ekleme / silme yalnızca çevresindeki chunk'ları değiştirir; sonraki ilk ortak sınırdan
+    # itibaren parçalar aynıdır ve embedding cache'ten gelir. Her chunk en fazla chunk_size
+    # karakterdir ve önceki chunk'ın son ~overlap karakteriyle başlar.
+    body_max = max(1, chunk_size - overlap)
+    body_min = body_max * 3 // 4
+    window = deque(maxlen=CHUNK_HASH_WORDS)
+    tail = ""
+    body = []
+    size = 0
     chunk_id = 0
 
-    while start < len(text):
-        end = start + chunk_size
-        piece = text[start:end].strip()
+    for word in _iter_words(pages, body_max):
+        window.append(word)
+        if body and size + 1 + len(word) > body_max:
+            text = " ".join(body)
+            yield {"doc_id": doc_id, "chunk_id": chunk_id, "text": f"{tail} {text}" if tail else text}
+            tail, body, size, chunk_id = _overlap_tail(text, overlap), [], 0, chunk_id + 1
 
-        if piece:
-            chunks.append({"doc_id": doc_id, "chunk_id": chunk_id, "text": piece})
+        body.append(word)
+        size += len(word) + (1 if size else 0)
 
-        start = end - overlap
-        chunk_id += 1
+        if size >= body_min and _is_cut_point(window):
+            text = " ".join(body)
+            yield {"doc_id": doc_id, "chunk_id": chunk_id, "text": f"{tail} {text}" if tail else text}
+            tail, body, size, chunk_id = _overlap_tail(text, overlap), [], 0, chunk_id + 1
 
-    return chunks
+    if body:
+        text = " ".join(body)
+        yield {"doc_id": doc_id, "chunk_id": chunk_id, "text": f"{tail} {text}" if tail else text}
+
+
+def chunk_text(text: str, doc_id: str, chunk_size: int = 800, overlap: int = 150):
+    return list(iter_chunks([text], doc_id, chunk_size=chunk_size, overlap=overlap))
 
 
 # --------------------------------------------------
-# MMR (DIVERSITY SELECTION)
+# FAISS INDEKS FABRİKASI
 # --------------------------------------------------
-def mmr_select(query_vec, doc_vecs, candidates, k=3, lam=0.65):
-    selected = []
+def _ivf_nlist(n: int) -> int:
+    # ~4*sqrt(n) liste, her listeye en az ~39 eğitim vektörü düşecek şekilde
+    return max(1, min(int(4 * np.sqrt(n)), n // 39, 65536))
+
+
+def _pq_m(dim: int) -> int:
+    # Alt vektör başına ~8 boyut; m, dim'i tam bölmeli
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def min_train_size(index_type: str) -> int:
+    if index_type == "ivfpq":
+        return max(IVF_MIN_TRAIN, PQ_MIN_TRAIN)
+    return IVF_MIN_TRAIN
+
+
+_SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def _train_sq(index, sq, train_vectors):
+    # float16 eğitim istemez; int8 boyut başına min/max aralığını veriden öğrenir
+    if index.is_trained:
+        return
+    if train_vectors is None or len(train_vectors) == 0:
+        raise RuntimeError("int8 depolama eğitim vektörü olmadan oluşturulamaz.")
+    sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+    sq.rangestat_arg = SQ_RANGE_MARGIN
+    index.train(np.ascontiguousarray(train_vectors, dtype="float32"))
+
 
-    while candidates and len(selected) < k:
-        best = None
-        best_score = -1e9
+def make_index(index_type: str, dim: int, train_vectors=None, storage: str = "float32"):
+    if storage not in VECTOR_STORAGES:
+        raise RuntimeError(f"Bilinmeyen vektör depolama: {storage} (seçenekler: {', '.join(VECTOR_STORAGES)})")
+    if storage != "float32" and index_type == "ivfpq":
+        raise RuntimeError("ivfpq vektörleri zaten PQ ile sıkıştırır; float16/int8 depolama ile kullanılamaz.")
 
-        for idx in candidates:
-            rel = float(np.dot(query_vec, doc_vecs[idx]))
-            div = (
-                max([float(np.dot(doc_vecs[idx], doc_vecs[s])) for s in selected])
-                if selected
-                else 0.0
+    if index_type == "flat":
+        if storage == "float32":
+            return faiss.IndexFlatIP(dim)
+        index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[storage], faiss.METRIC_INNER_PRODUCT)
+        _train_sq(index, index.sq, train_vectors)
+        return index
+
+    if index_type == "hnsw":
+        if storage == "float32":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[storage], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            _train_sq(index, faiss.downcast_index(index.storage).sq, train_vectors)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    if index_type in ("ivf", "ivfpq"):
+        if train_vectors is None or len(train_vectors) == 0:
+            raise RuntimeError(f"{index_type} indeksi eğitim vektörü olmadan oluşturulamaz.")
+
+        nlist = _ivf_nlist(len(train_vectors))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivfpq":
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, _pq_m(dim), 8, faiss.METRIC_INNER_PRODUCT
+            )
+        elif storage == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dim, nlist, _SQ_TYPES[storage], faiss.METRIC_INNER_PRODUCT
             )
-            score = lam * rel - (1 - lam) * div
+            index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            index.sq.rangestat_arg = SQ_RANGE_MARGIN
+        index.train(np.ascontiguousarray(train_vectors, dtype="float32"))
+        index.nprobe = min(IVF_NPROBE, nlist)
+        return index
+
+    raise RuntimeError(f"Bilinmeyen indeks tipi: {index_type} (seçenekler: {', '.join(INDEX_TYPES)})")
+
+
+def base_index(index):
+    # IndexIDMap sarmalayıcısının altındaki asıl indeks (IVF sarılmadan kullanılır)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_params(index, nprobe: int | None = None, ef_search: int | None = None):
+    index = base_index(index)
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+def index_storage(index) -> str:
+    # İndeksin vektörleri hangi hassasiyette tuttuğu (float32 | float16 | int8)
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    sq = getattr(index, "sq", None)
+    if sq is None:
+        return "float32"
+    for storage, qtype in _SQ_TYPES.items():
+        if sq.qtype == qtype:
+            return storage
+    return "float32"
+
+
+def index_nbytes(index) -> int:
+    # Serileştirmeden yaklaşık boyut: vektör kodları + ID eşlemesi + HNSW grafı / IVF merkezleri
+    total = 0
+    if isinstance(index, faiss.IndexIDMap):
+        total += index.id_map.size() * 8
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        total += index.hnsw.neighbors.size() * 4 + index.hnsw.offsets.size() * 8 + index.hnsw.levels.size() * 4
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, faiss.IndexIVF):
+        # Ters listelerde her kodun yanında 8 baytlık ID tutulur; direct map ID -> liste konumu
+        total += index.quantizer.ntotal * index.d * 4 + index.ntotal * 8
+        if index.direct_map.type == faiss.DirectMap.Array:
+            total += index.direct_map.array.size() * 8
+        elif index.direct_map.type == faiss.DirectMap.Hashtable:
+            total += index.ntotal * 16
+    pq = getattr(index, "pq", None)
+    if pq is not None:
+        total += pq.centroids.size() * 4
+    return total + index.ntotal * getattr(index, "code_size", index.d * 4)
+
+
+class IndexVectors:
+    # Sıkıştırılmış depolamada doc_embeddings yerine geçer: satırlar (FAISS ID'leri)
+    # indeksten float32 olarak çözülür. Yalnızca canlı satırlar okunabilir.
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            rows = np.arange(rows.start or 0, rows.stop)
+        rows = np.ascontiguousarray(rows, dtype="int64")
+        if len(rows) == 0:
+            return np.empty((0, self.index.d), dtype="float32")
+        return self.index.reconstruct_batch(rows)
+
+
+# --------------------------------------------------
+# MMR (DIVERSITY SELECTION)
+# --------------------------------------------------
+def mmr_select(query_vec, doc_vecs, candidates, k=3, lam=0.65, relevance=None):
+    # relevance verilirse (adaylarla aynı sırada) sorgu benzerliği yerine kullanılır
+    if not candidates or k <= 0:
+        return []
+
+    cand = np.asarray(candidates, dtype=np.int64)
+    sub = np.asarray(doc_vecs[cand], dtype=np.float32)
+    if relevance is None:
+        rel = (sub @ np.asarray(query_vec, dtype=np.float32)).astype(np.float64)
+    else:
+        rel = np.asarray(relevance, dtype=np.float64)
+
+    # Her aday için seçilmişlere olan en yüksek benzerlik; her turda artımlı güncellenir
+    max_sim = np.zeros(len(cand), dtype=np.float64)
+    available = np.ones(len(cand), dtype=bool)
+    selected = []
+
+    for _ in range(min(k, len(cand))):
+        scores = lam * rel - (1 - lam) * max_sim
+        scores[~available] = -np.inf
 
-            if score > best_score:
-                best_score = score
-                best = idx
+        best = int(np.argmax(scores))
+        selected.append(int(cand[best]))
+        available[best] = False
 
-        selected.append(best)
-        candidates.remove(best)
+        sims = (sub @ sub[best]).astype(np.float64)
+        max_sim = sims if len(selected) == 1 else np.maximum(max_sim, sims)
 
     return selected
 
 
-def call_llm(prompt: str, max_tokens: int = 300, temperature: float = 0.2) -> str:
-    if not HF_TOKEN:
-        raise RuntimeError("HF_TOKEN tanımlı değil. Ortam değişkeni olarak ayarlayın.")
-
-    headers = {
-        "Authorization": f"Bearer {HF_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    env_models = [m.strip() for m in HF_MODELS.split(",") if m.strip()]
-    base_models = [HF_MODEL] + env_models
-
-    # Preserve order, remove duplicates
-    seen = set()
-    models_to_try = []
-    for model in base_models:
-        if model and model not in seen:
-            seen.add(model)
-            models_to_try.append(model)
-
-    # Try both provider-qualified and bare model names when needed
-    expanded = []
-    for model in models_to_try:
-        expanded.append(model)
-        if ":" in model:
-            bare = model.split(":", 1)[0]
-            if bare not in expanded:
-                expanded.append(bare)
-    models_to_try = expanded
-
-    last_error = None
-
-    for model_name in models_to_try:
-        payload = {
-            "model": model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": False,
-        }
+def mmr_select_many(query_vecs, doc_vecs, candidates_list, ks, lams, relevances=None):
+    # mmr_select'in soru listesi hali: aday listeleri aynı genişliğe doldurulur ve her
+    # turda tüm soruların en iyi adayı birlikte seçilir (soru başına Python döngüsü yok)
+    n = len(candidates_list)
+    width = max((len(c) for c in candidates_list), default=0)
+    if width == 0:
+        return [[] for _ in range(n)]
+
+    cand = np.zeros((n, width), dtype=np.int64)
+    valid = np.zeros((n, width), dtype=bool)
+    for i, candidates in enumerate(candidates_list):
+        cand[i, : len(candidates)] = candidates
+        valid[i, : len(candidates)] = True
+
+    # Ortak aday satırları bir kez okunur (sıkıştırılmış depolamada indeksten çözülür)
+    uniq, inverse = np.unique(cand[valid], return_inverse=True)
+    rows_vecs = np.asarray(doc_vecs[uniq], dtype=np.float32)
+    sub = np.zeros((n, width, rows_vecs.shape[1]), dtype=np.float32)
+    sub[valid] = rows_vecs[inverse]
+
+    rel = np.einsum("bcd,bd->bc", sub, np.asarray(query_vecs, dtype=np.float32)).astype(np.float64)
+    for i, relevance in enumerate(relevances or []):
+        if relevance is not None:
+            rel[i, : len(relevance)] = relevance
+    lam = np.asarray(lams, dtype=np.float64)[:, None]
+    ks = np.minimum(np.asarray(ks, dtype=np.int64), valid.sum(axis=1))
+
+    max_sim = np.zeros((n, width), dtype=np.float64)
+    available = valid.copy()
+    selected = [[] for _ in range(n)]
+    rows = np.arange(n)
+
+    for step in range(int(ks.max())):
+        scores = lam * rel - (1 - lam) * max_sim
+        scores[~available] = -np.inf
+
+        best = np.argmax(scores, axis=1)
+        active = np.flatnonzero(ks > step)
+        for i in active:
+            selected[i].append(int(cand[i, best[i]]))
+        available[active, best[active]] = False
+
+        sims = np.einsum("bcd,bd->bc", sub, sub[rows, best]).astype(np.float64)
+        max_sim = sims if step == 0 else np.maximum(max_sim, sims)
 
-        try:
-            r = requests.post(
-                HF_URL,
-                headers=headers,
-                json=payload,
-                timeout=REQUEST_TIMEOUT,
-            )
-        except requests.RequestException as e:
-            last_error = str(e)
-            continue
+    return selected
 
-        if r.status_code >= 400:
-            body = r.text.strip()
-            last_error = f"{r.status_code} {r.reason}: {body}"
-            continue
 
-        try:
-            data = r.json()
-        except ValueError as e:
-            raise RuntimeError("HuggingFace API geçersiz JSON döndürdü.") from e
+# --------------------------------------------------
+# SORGU EMBEDDING MICRO-BATCH
+# --------------------------------------------------
+def _deliver(fut: Future, result=None, exception=None):
+    try:
+        if exception is not None:
+            fut.set_exception(exception)
+        else:
+            fut.set_result(result)
+    except Exception:
+        # Future başka yoldan sonuçlanmışsa (InvalidStateError) yok sayılır
+        pass
+
+
+class QueryBatcher:
+    def __init__(self, encode_fn, max_batch: int = EMBED_BATCH_MAX, max_wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._size_counts = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._encode_total = 0.0
+
+    def submit(self, text: str) -> Future:
+        fut = Future()
+        if self.max_batch == 1:
+            try:
+                fut.set_result(self.encode_fn([text])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+
+        self._ensure_thread()
+        self._queue.put((text, fut, time.monotonic()))
+        return fut
+
+    def encode(self, text: str):
+        return self.submit(text).result()
+
+    def _ensure_thread(self):
+        # Thread beklenmedik biçimde ölürse bir sonraki submit yenisini başlatır
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="rag-query-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Süre dolsa bile kuyrukta bekleyenler alınır
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._encode_batch(batch)
+            except Exception:
+                # Tek bir batch'teki hata tüm async sorguları kilitlememeli; thread ayakta kalır
+                continue
+
+    def _encode_batch(self, batch):
+        # İptal edilmiş future'lar (istemci koptu, aask iptal edildi) encode edilmez;
+        # set_running_or_notify_cancel sonrası kalanlar artık iptal edilemez
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
 
+        start = time.monotonic()
         try:
-            return data["choices"][0]["message"]["content"].strip()
+            vectors = self.encode_fn([text for text, _, _ in batch])
         except Exception as e:
-            raise RuntimeError(f"HuggingFace API yanıt formatı beklenen yapıda değil: {data}") from e
+            for _, fut, _ in batch:
+                _deliver(fut, exception=e)
+            return
 
-    raise RuntimeError(
-        "HuggingFace API isteği başarısız. "
-        f"Denenen modeller: {models_to_try}. Son hata: {last_error}"
-    )
+        for (_, fut, _), vec in zip(batch, vectors):
+            _deliver(fut, result=vec)
+
+        self._record(batch, start)
+
+    def _record(self, batch, start: float):
+        end = time.monotonic()
+        waits = [start - queued_at for _, _, queued_at in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._size_counts[len(batch)] = self._size_counts.get(len(batch), 0) + 1
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+            self._encode_total += end - start
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._batches or 1
+            items = self._items or 1
+            return {
+                "max_batch": self.max_batch,
+                "wait_window_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "queries": self._items,
+                "avg_batch_size": self._items / batches,
+                "batch_size_counts": dict(sorted(self._size_counts.items())),
+                "avg_wait_ms": self._wait_total / items * 1000,
+                "max_wait_ms": self._wait_max * 1000,
+                "avg_encode_ms": self._encode_total / batches * 1000,
+                "queue_depth": self._queue.qsize(),
+            }
+
+
+# --------------------------------------------------
+# MOTOR DURUMU (bellek içi snapshot)
+# --------------------------------------------------
+class EngineState:
+    # İndeks, vektörler, chunk'lar ve satır bilgileri tek nesnede; motorda yayınlandıktan
+    # sonra değiştirilmez. Yazarlar draft() ile kopya alıp değiştirir ve tek atamayla
+    # yerine koyar; sorgular durumu başta bir kez alır, kilitsiz ve tutarlı okur.
+    def __init__(
+        self,
+        index=None,
+        doc_embeddings=None,
+        chunks=None,
+        alive=None,
+        lexical=None,
+        doc_rows=None,
+        doc_hashes=None,
+        trained_size=0,
+    ):
+        self.index = index
+        # Yalnızca float32 depolamada dolu; sıkıştırılmış modlarda vektörler indekstedir
+        self.doc_embeddings = doc_embeddings
+        self.chunks = chunks if chunks is not None else []
+        # Satır i silinmişse alive[i] False; silinen satırlar sıkıştırmaya kadar yerinde kalır
+        self.alive = alive
+        # BM25 ters indeksi; satırları FAISS ID'leriyle aynı
+        self.lexical = lexical if lexical is not None else LexicalIndex()
+        # doc_id -> [(başlangıç, bitiş)) satır aralıkları; doküman içi arama için
+        self.doc_rows = doc_rows if doc_rows is not None else {}
+        # doc_id -> chunk metinlerinin özeti (hash); özet önbelleği bununla doğrulanır
+        self.doc_hashes = doc_hashes if doc_hashes is not None else {}
+        # İndeks kurulurken (eğitilirken) kullanılan canlı satır sayısı; yeniden eğitim ölçütü
+        self.trained_size = trained_size
+        # Taslakta indeks ilk değişiklikten önce klonlanır (bkz. writable_index)
+        self._owns_index = True
+
+    def draft(self) -> "EngineState":
+        # Yazar kopyası: liste / sözlük / alive kopyalanır. FAISS indeksi ve sözcük indeksi
+        # pahalı olduğundan ancak değiştirilecekleri zaman kopyalanır; doc_embeddings
+        # yerinde değiştirilmez (eklemede np.vstack yeni dizi üretir)
+        out = EngineState(
+            self.index,
+            self.doc_embeddings,
+            list(self.chunks),
+            np.array(self.alive) if self.alive is not None else None,
+            self.lexical,
+            {d: list(ranges) for d, ranges in self.doc_rows.items()},
+            dict(self.doc_hashes),
+            self.trained_size,
+        )
+        out._owns_index = self.index is None
+        return out
+
+    def writable_index(self):
+        if not self._owns_index:
+            self.index = faiss.clone_index(self.index)
+            self._owns_index = True
+        return self.index
+
+    def chunk_count(self) -> int:
+        return sum(end - start for ranges in self.doc_rows.values() for start, end in ranges)
+
+    def tombstone_count(self) -> int:
+        return len(self.chunks) - self.chunk_count()
+
+    @property
+    def vectors(self):
+        # Satır numarasıyla okunan embedding deposu (float32 dizi ya da indeksten çözme)
+        if self.doc_embeddings is not None:
+            return self.doc_embeddings
+        return IndexVectors(self.index)
+
+    def row_vectors(self, count: int):
+        # İlk count satırın float32 vektörleri; silinmiş satırlar sıfır
+        if self.doc_embeddings is not None:
+            return self.doc_embeddings[:count]
+        out = np.zeros((count, self.index.d), dtype="float32")
+        rows = np.flatnonzero(self.alive[:count])
+        out[rows] = self.vectors[rows]
+        return out
+
+    def doc_chunk_rows(self, doc_id: str) -> list:
+        return [row for start, end in self.doc_rows.get(doc_id, []) for row in range(start, end)]
+
+    def compute_doc_hash(self, doc_id: str) -> str:
+        h = hashlib.sha256()
+        for row in self.doc_chunk_rows(doc_id):
+            h.update(self.chunks[row]["text"].encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def rebuild_doc_rows(self):
+        # Silinmiş satırlar hiçbir aralığa girmez
+        doc_rows = {}
+        start = None
+        for row in range(len(self.chunks) + 1):
+            live = row < len(self.chunks) and bool(self.alive[row])
+            if start is not None and (
+                not live or self.chunks[row]["doc_id"] != self.chunks[start]["doc_id"]
+            ):
+                doc_rows.setdefault(self.chunks[start]["doc_id"], []).append((start, row))
+                start = None
+            if live and start is None:
+                start = row
+        self.doc_rows = doc_rows
 
 
 # --------------------------------------------------
 # RAG ENGINE
 # --------------------------------------------------
+def torch_device() -> str:
+    import torch
+
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
 class RAGEngine:
     def __init__(
         self,
         embedding_model="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+        index_type: str = INDEX_TYPE,
+        storage: str = VECTOR_STORAGE,
+        shared_dir: str = SHARED_INDEX_DIR,
     ):
-        device = (
-            "mps"
-            if torch.backends.mps.is_available()
-            else "cuda" if torch.cuda.is_available() else "cpu"
-        )
+        if index_type not in INDEX_TYPES:
+            raise RuntimeError(f"Bilinmeyen indeks tipi: {index_type} (seçenekler: {', '.join(INDEX_TYPES)})")
+        if storage not in VECTOR_STORAGES:
+            raise RuntimeError(f"Bilinmeyen vektör depolama: {storage} (seçenekler: {', '.join(VECTOR_STORAGES)})")
+        if storage != "float32" and index_type == "ivfpq":
+            raise RuntimeError("ivfpq vektörleri zaten PQ ile sıkıştırır; float16/int8 depolama ile kullanılamaz.")
+
+        # torch yalnızca torch backend'inde import edilir
+        device = torch_device() if EMBED_BACKEND == "torch" else "cpu"
+
+        print(f"Embedding modeli yükleniyor ({device if EMBED_BACKEND == 'torch' else EMBED_BACKEND})...")
+        self.embedding_model_name = embedding_model
+        # torch ya da ONNX Runtime (CPU); ikisi de normalize float32 vektör döndürür
+        self.encoder = open_encoder(embedding_model, device)
+        self.index_type = index_type
+        self.storage = storage
+        self.executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="rag-cpu")
+        self.query_batcher = QueryBatcher(self._encode_queries)
+        self.embed_cache = open_embedding_cache(self.encoder.cache_key)
+        self.reranker = open_reranker()
+        self.count_tokens = make_token_counter(self.encoder.tokenizer)
+
+        # Yazanlar (ingest, silme, sıkıştırma) sırayla çalışır ve yeni durumu tek atamayla
+        # yayınlar; sorgular self.state'i bir kez okur, kilit almaz
+        self._write_lock = threading.RLock()
+        # Yalnızca _compacting bayrağını korur; ortak modda yazma kilidi başka bir worker'ın
+        # yayınını beklerken tutulabilir, sıkıştırma kararı onu beklememeli
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+        self.state = EngineState()
+
+        # doc_id -> {"hash", "model", "sections": [{"chunk_ids", "summary"}], "summary"}
+        self.summaries = {}
+        # doc_id -> sürmekte olan özet çıkarımının Future'ı; sync, async ve arka plan
+        # yolları aynı dokümanı tek bir map-reduce ile çıkarır
+        self._summary_builds = {}
+        self._summary_builds_lock = threading.Lock()
+
+        # Çok process'li mod: indeks ortak dizindeki güncel sürümden salt-okunur eşlenir,
+        # yeni sürümler arka planda izlenir; yazmalar yeni sürüm olarak yayınlanır
+        self.shared = open_shared_index(shared_dir)
+        self.version = None
+        self._writing_depth = 0
+        if self.shared is not None:
+            with self._write_lock:
+                self._open_version(self.shared.current(), republish=True)
+            threading.Thread(target=self._watch_shared, name="rag-shared-watch", daemon=True).start()
+
+    def reset(self):
+        with self._writing():
+            self._clear()
 
-        print(f"Embedding modeli yükleniyor ({device})...")
-        self.embed_model = SentenceTransformer(embedding_model, device=device)
+    def _clear(self):
+        self.state = EngineState()
+        self.summaries = {}
 
-        self.chunks = []
-        self.doc_embeddings = None
-        self.index = None
+    def doc_ids(self):
+        return list(self.state.doc_rows)
 
-    def reset(self):
-        self.chunks = []
-        self.doc_embeddings = None
-        self.index = None
+    def chunk_count(self) -> int:
+        return self.state.chunk_count()
+
+    def tombstone_count(self) -> int:
+        return self.state.tombstone_count()
+
+    @property
+    def vectors(self):
+        return self.state.vectors
+
+    # --------------------------------------------------
+    # SNAPSHOT (DISK)
+    # --------------------------------------------------
+    def save(self, path: str):
+        # Yazma kilidi: kayıt sırasında ingest/silme/sıkıştırma durumu değiştiremez
+        with self._write_lock:
+            self._save(path)
+
+    def _save(self, path: str):
+        state = self.state
+        if state.index is None:
+            raise RuntimeError("Kaydedilecek indeks yok.")
+
+        path = os.path.abspath(path)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        os.makedirs(tmp_path)
+
+        try:
+            faiss.write_index(state.index, os.path.join(tmp_path, "index.faiss"))
+            if state.doc_embeddings is not None:
+                np.save(os.path.join(tmp_path, "embeddings.npy"), state.doc_embeddings)
+            np.save(os.path.join(tmp_path, "alive.npy"), state.alive)
+            state.lexical.save(os.path.join(tmp_path, "lexical"))
+            save_chunks(os.path.join(tmp_path, "chunks"), state.chunks)
+
+            with open(os.path.join(tmp_path, "summaries.json"), "w", encoding="utf-8") as f:
+                json.dump(self.summaries, f, ensure_ascii=False)
+
+            # Satır aralıkları ve hash'ler: açılışta chunk metinlerini baştan okumamak için
+            with open(os.path.join(tmp_path, "docs.json"), "w", encoding="utf-8") as f:
+                json.dump({"doc_rows": state.doc_rows, "doc_hashes": state.doc_hashes}, f, ensure_ascii=False)
+
+            meta = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "embedding_model": self.embedding_model_name,
+                "index_type": self.index_type,
+                "storage": index_storage(state.index),
+                "dim": int(state.index.d),
+                "chunk_count": len(state.chunks),
+                "trained_size": state.trained_size,
+                "nlist": int(base_index(state.index).nlist) if isinstance(base_index(state.index), faiss.IndexIVF) else None,
+                "created_at": time.time(),
+            }
+            # meta.json en son yazılır; varlığı snapshot'ın tamamlandığını gösterir.
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+
+            old_path = None
+            if os.path.exists(path):
+                old_path = f"{path}.old-{uuid.uuid4().hex}"
+                os.rename(path, old_path)
+            os.rename(tmp_path, path)
+            if old_path:
+                shutil.rmtree(old_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    def load(self, path: str):
+        with self._writing():
+            self._load_snapshot(path)
+        print(f"Snapshot yüklendi ({path}). Toplam chunk: {self.chunk_count()}")
+
+    def _load_snapshot(self, path: str, mmap: bool = False) -> bool:
+        # mmap=True: indeks, vektörler, chunk'lar ve sözcük indeksi dosyalardan salt-okunur
+        # eşlenir (process'ler arası paylaşılır). Snapshot bu motorun ayarlarına göre yeniden
+        # kurulmayı gerektiriyorsa eşlenemez; durum değiştirilmeden False döner
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise RuntimeError(f"Snapshot bulunamadı: {path}")
+
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta.get("format_version") not in (1, 2, SNAPSHOT_FORMAT_VERSION):
+            raise RuntimeError(
+                f"Snapshot formatı desteklenmiyor: {meta.get('format_version')} "
+                f"(beklenen {SNAPSHOT_FORMAT_VERSION})"
+            )
+        if meta.get("embedding_model") != self.embedding_model_name:
+            raise RuntimeError(
+                "Snapshot farklı bir embedding modeli ile oluşturulmuş: "
+                f"{meta.get('embedding_model')} != {self.embedding_model_name}"
+            )
+
+        mmap_mode = "r" if mmap else None
+        index_path = os.path.join(path, "index.faiss")
+        if mmap:
+            # Kodlar (flat / SQ / HNSW / IVF listeleri) sayfa önbelleğinden paylaşılır
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            index = faiss.read_index(index_path, flags)
+        else:
+            index = faiss.read_index(index_path)
+        # Sıkıştırılmış depolamalı snapshot'larda ayrı embedding kopyası yoktur
+        embeddings_path = os.path.join(path, "embeddings.npy")
+        doc_embeddings = np.load(embeddings_path, mmap_mode=mmap_mode) if os.path.exists(embeddings_path) else None
+        # v1/v2 snapshot'larda chunk'lar tek JSON dosyasında
+        chunks_path = os.path.join(path, "chunks")
+        if os.path.isdir(chunks_path):
+            chunks = load_chunks(chunks_path, mmap)
+        else:
+            with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+                chunks = json.load(f)
+
+        alive_path = os.path.join(path, "alive.npy")
+        if os.path.exists(alive_path):
+            alive = np.load(alive_path, mmap_mode=mmap_mode)
+        else:
+            alive = np.ones(len(chunks), dtype=bool)
+
+        if not (len(chunks) == len(alive) == meta.get("chunk_count")) or (
+            doc_embeddings is not None and len(doc_embeddings) != len(chunks)
+        ):
+            raise RuntimeError("Snapshot tutarsız: embedding ve chunk sayıları eşleşmiyor.")
+        if index.ntotal not in (int(alive.sum()), len(alive)):
+            raise RuntimeError("Snapshot tutarsız: indeks boyutu chunk sayısıyla eşleşmiyor.")
+
+        # İndeks tipi / depolama değiştiyse ya da v1 (ID eşlemesiz) snapshot ise
+        # yeniden embed etmeden kayıtlı (ya da indeksten çözülen) vektörlerden kurulur
+        # int8 için eğitim vektörü beklerken kaydedilmiş float16 indeks olduğu gibi açılır;
+        # sonraki eklemede int8'e geçer. Kaydedilmiş int8 indeks zaten eğitilmiştir: silmelerle
+        # canlı satır SQ_MIN_TRAIN'in altına düşse de yeniden kurulmaz
+        old_type = meta.get("index_type", "flat")
+        old_storage = index_storage(index)
+        needs_rebuild = (
+            old_type != self.index_type
+            or old_storage not in (self.storage, "float16" if self.storage == "int8" else None)
+            or meta.get("format_version") == 1
+        )
+        if mmap and needs_rebuild:
+            return False
+
+        # Eski snapshot'larda sözcük indeksi yok ya da tek .npz dosyasında
+        lexical_path = os.path.join(path, "lexical")
+        if os.path.isdir(lexical_path):
+            lexical = LexicalIndex.load(lexical_path, mmap)
+        elif os.path.exists(lexical_path + ".npz"):
+            lexical = LexicalIndex.load(lexical_path + ".npz")
+        else:
+            lexical = LexicalIndex.from_texts([c["text"] for c in chunks])
+        if len(lexical) != len(chunks):
+            raise RuntimeError("Snapshot tutarsız: sözcük indeksi chunk sayısıyla eşleşmiyor.")
+
+        docs = None
+        docs_path = os.path.join(path, "docs.json")
+        if os.path.exists(docs_path):
+            with open(docs_path, encoding="utf-8") as f:
+                docs = json.load(f)
+
+        summaries = {}
+        summaries_path = os.path.join(path, "summaries.json")
+        if os.path.exists(summaries_path):
+            with open(summaries_path, encoding="utf-8") as f:
+                summaries = json.load(f)
+
+        # Eski snapshot'larda eğitim boyutu yok: mevcut canlı satır sayısı varsayılır
+        state = EngineState(index, doc_embeddings, chunks, alive, lexical, trained_size=meta.get("trained_size") or int(alive.sum()))
+        if docs is not None:
+            state.doc_rows = {d: [tuple(r) for r in ranges] for d, ranges in docs["doc_rows"].items()}
+            state.doc_hashes = docs["doc_hashes"]
+        else:
+            state.rebuild_doc_rows()
+            state.doc_hashes = {d: state.compute_doc_hash(d) for d in state.doc_rows}
+
+        if needs_rebuild:
+            print(
+                f"İndeks {old_type}/{old_storage} -> {self.index_type}/{self.storage} "
+                "olarak yeniden kuruluyor..."
+            )
+            self._rebuild_index(state)
+        elif self.storage != "float32":
+            state.doc_embeddings = None
+
+        with self._write_lock:
+            self.state = state
+            # Yalnızca içeriği değişmemiş dokümanların özetleri tutulur; bellekte
+            # çıkarılmış ama henüz kaydedilmemiş özetler de korunur
+            self.summaries = {
+                d: tree
+                for d, tree in {**summaries, **self.summaries}.items()
+                if tree.get("hash") == state.doc_hashes.get(d)
+            }
+        return True
+
+    # --------------------------------------------------
+    # ORTAK İNDEKS (çok process'li mod)
+    # --------------------------------------------------
+    @contextmanager
+    def _writing(self):
+        # Durumu değiştiren her işlem bunun içinde çalışır. Ortak modda process'ler arası
+        # yazar kilidi alınır, güncel sürüm yazılabilir (özel kopya) açılır, değişiklik
+        # yeni sürüm olarak yayınlanır ve process yeniden salt-okunur eşlemeye döner
+        with self._write_lock:
+            if self.shared is None or self._writing_depth:
+                self._writing_depth += 1
+                try:
+                    yield
+                finally:
+                    self._writing_depth -= 1
+                return
+
+            try:
+                with self.shared.writer_lock():
+                    current = self.shared.current()
+                    if current is None:
+                        self._clear()
+                    else:
+                        self._load_snapshot(self.shared.version_path(current))
+
+                    self._writing_depth += 1
+                    try:
+                        yield
+                    finally:
+                        self._writing_depth -= 1
+                    self.shared.publish(self._save if self.state.index is not None else None)
+            finally:
+                # Hata olursa yarım kalan değişiklikler atılır, son yayınlanan sürüme dönülür
+                self._open_version(self.shared.current())
+
+    def _open_version(self, version: str | None, republish: bool = False):
+        # Yazma kilidi altında çağrılır
+        if version is not None and not self._load_snapshot(self.shared.version_path(version), mmap=True):
+            # Sürüm bu process'in ayarlarından farklı kurulmuş (eski format, başka indeks
+            # tipi / depolama). Açılışta bir kez yeniden kurulup yeni sürüm olarak yayınlanır;
+            # sonradan gelen böyle bir sürüm (ayarları farklı başka worker) yalnızca bu
+            # process'te yeniden kurulur, worker'lar birbirinin sürümünü sürekli ezmesin
+            if not republish:
+                print(f"Ortak indeks sürümü {version} bu ayarlarla eşlenemiyor; yerel kopya kuruluyor.")
+                self._load_snapshot(self.shared.version_path(version))
+                self.version = version
+                return
+            with self.shared.writer_lock():
+                version = self.shared.current()
+                if version is not None and not self._load_snapshot(self.shared.version_path(version), mmap=True):
+                    self._load_snapshot(self.shared.version_path(version))
+                    version = self.shared.publish(self._save)
+                    self._load_snapshot(self.shared.version_path(version), mmap=True)
+        if version is None:
+            self._clear()
+        self.version = version
+
+    def sync_shared(self) -> bool:
+        # Başka bir process yeni sürüm yayınladıysa ona geçilir
+        if self.shared is None or self.shared.current() == self.version:
+            return False
+        with self._write_lock:
+            version = self.shared.current()
+            if version == self.version:
+                return False
+            self._open_version(version)
+        print(f"Ortak indeks sürümü açıldı ({version}). Toplam chunk: {self.chunk_count()}")
+        return True
+
+    def _watch_shared(self):
+        while True:
+            time.sleep(SHARED_POLL_S)
+            try:
+                self.sync_shared()
+            except Exception as e:
+                print(f"Ortak indeks güncellenemedi: {e}")
 
     def _is_summary_question(self, question: str) -> bool:
         q = question.lower()
@@ -292,114 +1131,714 @@ SORU:
 JSON:
 """.strip()
 
-    def ask_stream(self, question: str, top_k: int = 6, doc_id: str | None = None):
-        result = self.ask(question, top_k=top_k, doc_id=doc_id)
-        if "hata" in result:
-            yield f"[ERROR] {result['hata']}"
-            return
-        yield result["cevap"]
-
     # --------------------------------------------------
-    def build_from_pdf(self, pdf_path: str, doc_id: str | None = None):
-        if not os.path.exists(pdf_path):
-            raise RuntimeError(f"{pdf_path} bulunamadı.")
+    # HİYERARŞİK ÖZET ÖNBELLEĞİ
+    # --------------------------------------------------
+    def _is_generic_summary_question(self, question: str) -> bool:
+        # "genel", "konusu" gibi kelimeler belirli sorularda da geçer; bölüm özetleri kayıplı
+        # olduğundan önbellek yalnızca dokümanın tamamını soran sorularda kullanılır
+        return self._is_summary_question(question) and set(analyze(question)) <= GENERIC_SUMMARY_TERMS
+
+    def _summary_doc_ids(self, question: str, doc_id) -> list | None:
+        # Önbellekten cevaplanacak dokümanlar; None ise eski retrieval yolu kullanılır
+        if not SUMMARY_CACHE or not self._is_generic_summary_question(question):
+            return None
+        doc_ids = [d for d in (self._resolve_doc_ids(doc_id) or self.doc_ids()) if d in self.state.doc_rows]
+        if not doc_ids or len(doc_ids) > SUMMARY_MAX_DOCS:
+            return None
 
-        text = read_pdf(pdf_path)
-        resolved_doc_id = doc_id or os.path.basename(pdf_path)
+        # Sürmekte olan (inline ya da arka plan) çıkarım beklenmez; soru retrieval ile cevaplanır
+        missing = [d for d in doc_ids if self._cached_summary_tree(d) is None]
+        if len(missing) > SUMMARY_INLINE_BUILDS or any(d in self._summary_builds for d in missing):
+            self._build_summaries_in_background(missing)
+            return None
+        return doc_ids
+
+    def _build_summaries_in_background(self, doc_ids: list):
+        def run(doc_id, fut):
+            try:
+                self._run_summary_build(doc_id, fut)
+            except Exception as e:
+                print(f"Özet çıkarılamadı ({doc_id}): {e}")
+
+        for doc_id in doc_ids:
+            fut, owner = self._claim_summary_build(doc_id)
+            if owner:
+                threading.Thread(target=run, args=(doc_id, fut), name="rag-summary", daemon=True).start()
+
+    def _claim_summary_build(self, doc_id: str):
+        # (future, sahip_mi): sahip çıkarımı yapar, diğerleri aynı future'ı bekler
+        with self._summary_builds_lock:
+            fut = self._summary_builds.get(doc_id)
+            if fut is not None:
+                return fut, False
+            fut = self._summary_builds[doc_id] = Future()
+            return fut, True
+
+    def _finish_summary_build(self, doc_id: str, fut: Future, tree=None, error=None):
+        with self._summary_builds_lock:
+            self._summary_builds.pop(doc_id, None)
+        _deliver(fut, result=tree, exception=error)
+
+    def _run_summary_build(self, doc_id: str, fut: Future):
+        try:
+            # Sahip olunana kadar başka bir çıkarım bitmiş olabilir
+            tree = self._cached_summary_tree(doc_id) or self._map_reduce_summary(doc_id)
+        except Exception as e:
+            self._finish_summary_build(doc_id, fut, error=e)
+            raise
+        self._finish_summary_build(doc_id, fut, tree=tree)
+        return tree
+
+    def _cached_summary_tree(self, doc_id: str):
+        tree = self.summaries.get(doc_id)
+        if tree and tree.get("hash") == self.state.doc_hashes.get(doc_id) and tree.get("model") == HF_MODEL:
+            return tree
+        return None
+
+    def _plan_summary_sections(self, doc_id: str):
+        # Doküman ardışık bölümlere ayrılır (map adımı). Bölüm bütçeyi aşıyorsa bölüm
+        # merkezine göre MMR ile temsilci chunk'lar seçilir, doküman sırasında paketlenir
+        state = self.state
+        doc_hash = state.doc_hashes.get(doc_id)
+        rows = state.doc_chunk_rows(doc_id)
+        tokens = [self.count_tokens(state.chunks[r]["text"]) for r in rows]
+
+        n_sections = max(1, min(SUMMARY_MAX_SECTIONS, len(rows), -(-sum(tokens) // SUMMARY_SECTION_TOKENS)))
+        bounds = np.linspace(0, len(rows), n_sections + 1).astype(int)
+
+        sections = []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            part = rows[a:b]
+            if not part:
+                continue
+            if sum(tokens[a:b]) > SUMMARY_SECTION_TOKENS:
+                vectors = state.vectors
+                centroid = vectors[part].mean(axis=0)
+                centroid /= np.linalg.norm(centroid) or 1.0
+                k = max(1, int(SUMMARY_SECTION_TOKENS * len(part) / sum(tokens[a:b])))
+                part = sorted(mmr_select(centroid, vectors, part, k=k, lam=0.5))
+
+            text, used = pack_context([state.chunks[r] for r in part], SUMMARY_SECTION_TOKENS, self.count_tokens)
+            if text:
+                sections.append({"chunk_ids": [c["chunk_id"] for c in used], "text": text})
+        return doc_hash, sections
+
+    def _build_section_prompt(self, text: str) -> str:
+        return f"""Aşağıdaki doküman bölümünü en fazla 3 cümleyle Türkçe özetle.
+Yalnızca bölümdeki bilgileri kullan, yorum ekleme.
+
+BÖLÜM:
+{text}
+
+ÖZET:
+""".strip()
 
-        new_chunks = chunk_text(text, resolved_doc_id)
+    def _build_reduce_prompt(self, section_summaries: list) -> str:
+        context = "\n".join(f"- {self._normalize_ws(t)}" for t in section_summaries)
+        return self._build_summary_prompt(context, "Dokümanın genel özeti nedir?")
+
+    def _store_summary_tree(self, doc_id: str, doc_hash: str, sections: list, section_summaries: list, raw_summary: str):
+        tree = {
+            "hash": doc_hash,
+            "model": HF_MODEL,
+            "created_at": time.time(),
+            "sections": [
+                {"chunk_ids": sec["chunk_ids"], "summary": self._normalize_ws(text)}
+                for sec, text in zip(sections, section_summaries)
+            ],
+            "summary": self._postprocess_summary(raw_summary),
+        }
+        # Özet çıkarılırken doküman değiştiyse önbelleğe yazılmaz
+        with self._write_lock:
+            if self.state.doc_hashes.get(doc_id) == doc_hash:
+                self.summaries[doc_id] = tree
+        return tree
+
+    def _summary_from_trees(self, question: str, trees: dict):
+        # ("hazır", cevap, kaynaklar) ya da ("prompt", prompt, kaynaklar) döner
+        sources = [
+            {"dosya": d, "parca": sec["chunk_ids"][0]}
+            for d, tree in trees.items()
+            for sec in tree["sections"]
+            if sec["chunk_ids"]
+        ]
+        if len(trees) == 1:
+            return "hazır", next(iter(trees.values()))["summary"], sources
+
+        context = "\n\n".join(f"[{d}] {tree['summary']}" for d, tree in trees.items())
+        return "prompt", self._build_summary_prompt(context, question), sources
+
+    def _ensure_summary_tree(self, doc_id: str):
+        tree = self._cached_summary_tree(doc_id)
+        if tree:
+            return tree
+
+        fut, owner = self._claim_summary_build(doc_id)
+        if not owner:
+            return fut.result()
+        return self._run_summary_build(doc_id, fut)
+
+    def _map_reduce_summary(self, doc_id: str):
+        doc_hash, sections = self._plan_summary_sections(doc_id)
+        with ThreadPoolExecutor(max_workers=SUMMARY_MAP_CONCURRENCY) as pool:
+            section_summaries = list(
+                pool.map(
+                    lambda sec: call_llm(
+                        self._build_section_prompt(sec["text"]),
+                        max_tokens=MAX_TOKENS_SECTION,
+                        temperature=0.0,
+                    ),
+                    sections,
+                )
+            )
+        raw = call_llm(
+            self._build_reduce_prompt(section_summaries),
+            max_tokens=MAX_TOKENS_SUMMARY,
+            temperature=0.15,
+        )
+        return self._store_summary_tree(doc_id, doc_hash, sections, section_summaries, raw)
 
-        if not new_chunks:
-            raise RuntimeError("PDF içeriği boş.")
+    def _summary_answer(self, question: str, doc_id=None):
+        # (cevap, kaynaklar) ya da önbellek kullanılamıyorsa None
+        doc_ids = self._summary_doc_ids(question, doc_id)
+        if doc_ids is None:
+            return None
+        return self._answer_from_summaries(question, doc_ids)
+
+    def _answer_from_summaries(self, question: str, doc_ids: list):
+        trees = {d: self._ensure_summary_tree(d) for d in doc_ids}
+        kind, payload, sources = self._summary_from_trees(question, trees)
+        if kind == "prompt":
+            payload = self._postprocess_summary(
+                call_llm(payload, max_tokens=MAX_TOKENS_SUMMARY, temperature=0.15)
+            )
+        return payload, sources
 
-        texts = [c["text"] for c in new_chunks]
+    def ask_stream(
+        self,
+        question: str,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+    ):
+        # Olaylar: {"token": ...} (birden çok), sonra {"kaynaklar": [...]}; hata olursa {"hata": ...}
+        try:
+            if self._is_summary_question(question):
+                cached = self._summary_answer(question, doc_id)
+                if cached is not None:
+                    yield {"token": cached[0]}
+                    yield {"kaynaklar": cached[1]}
+                    return
+
+            context, sources = self._hybrid_context(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            )
+            prompt = self._build_prompt(context, question)
+
+            if self._is_summary_question(question):
+                # JSON özet son işlemden geçmeden gösterilemez, tek parça gönderilir
+                answer = call_llm(prompt, max_tokens=MAX_TOKENS_SUMMARY, temperature=0.15)
+                yield {"token": self._postprocess_summary(answer)}
+            else:
+                for token in stream_llm(prompt, max_tokens=MAX_TOKENS_QA, temperature=0.0):
+                    yield {"token": token}
 
-        emb = self.embed_model.encode(
-            texts,
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        ).astype("float32")
+            yield {"kaynaklar": sources}
+        except Exception as e:
+            yield {"hata": str(e)}
 
-        if self.index is None:
-            dim = emb.shape[1]
-            self.index = faiss.IndexFlatIP(dim)
-            self.doc_embeddings = emb
+    # --------------------------------------------------
+    def build_from_pdf(self, pdf_path, doc_id: str | None = None, progress=None):
+        resolved_doc_id, new_chunks, emb = self._embed_pdf(pdf_path, doc_id, progress)
+        self._append_document(resolved_doc_id, new_chunks, emb)
+        print(f"{resolved_doc_id} yüklendi. Toplam chunk: {self.chunk_count()}")
+
+    def replace_document(self, doc_id: str, pdf_path, progress=None):
+        # Yeni sürüm önce embed edilir; eski satırlar ancak ekleme anında silinir,
+        # böylece işlem boyunca doküman sorgulanabilir kalır
+        _, new_chunks, emb = self._embed_pdf(pdf_path, doc_id, progress)
+        self._append_document(doc_id, new_chunks, emb, replace=True)
+        print(f"{doc_id} güncellendi. Toplam chunk: {self.chunk_count()}")
+
+    def remove_document(self, doc_id: str) -> int:
+        # Ortak modda doküman başka bir worker'da yeni eklenmiş olabilir
+        self.sync_shared()
+        if doc_id not in self.state.doc_rows:
+            return 0
+        with self._writing():
+            state = self.state.draft()
+            removed = self._drop_rows(state, doc_id)
+            self.state = state
+        if removed:
+            print(f"{doc_id} silindi ({removed} chunk). Toplam chunk: {self.chunk_count()}")
+        return removed
+
+    def _embed_pdf(self, pdf_path, doc_id: str | None, progress):
+        # pdf_path bir dosya yolu ya da ikili dosya nesnesi (BytesIO, upload buffer) olabilir.
+        # progress(pages_parsed=..., pages_total=..., chunks_embedded=...) ingest ilerledikçe çağrılır
+        if isinstance(pdf_path, str):
+            if not os.path.exists(pdf_path):
+                raise RuntimeError(f"{pdf_path} bulunamadı.")
+            resolved_doc_id = doc_id or os.path.basename(pdf_path)
         else:
-            self.doc_embeddings = np.vstack([self.doc_embeddings, emb])
+            if not doc_id:
+                raise RuntimeError("Dosya nesnesinden yüklemede doc_id zorunlu.")
+            resolved_doc_id = doc_id
+
+        pages_total = pdf_page_count(pdf_path) if progress else None
+        pages_parsed = 0
+
+        def counted_pages():
+            nonlocal pages_parsed
+            for page in iter_pdf_pages(pdf_path):
+                pages_parsed += 1
+                INGEST_PAGES.inc()
+                yield page
+
+        def report():
+            if progress:
+                progress(
+                    pages_parsed=pages_parsed,
+                    pages_total=pages_total,
+                    chunks_embedded=len(new_chunks),
+                )
+
+        # Sayfalar okundukça chunk'lanır ve gruplar halinde embed edilir; büyük PDF'lerde
+        # process pool sonraki sayfaları çıkarırken bu thread embedding yapar
+        new_chunks = []
+        parts = []
+        batch = []
+        started = time.perf_counter()
+        try:
+            for chunk in iter_chunks(counted_pages(), resolved_doc_id):
+                batch.append(chunk)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    parts.append(self._encode_passages(batch))
+                    new_chunks.extend(batch)
+                    INGEST_CHUNKS.inc(len(batch))
+                    batch = []
+                    report()
+            if batch:
+                parts.append(self._encode_passages(batch))
+                new_chunks.extend(batch)
+                INGEST_CHUNKS.inc(len(batch))
+        finally:
+            INGEST_SECONDS.inc(time.perf_counter() - started)
+        report()
 
-        self.index.add(emb)
-        self.chunks.extend(new_chunks)
+        if not new_chunks:
+            raise RuntimeError("PDF içeriği boş.")
 
-        print(f"{resolved_doc_id} yüklendi. Toplam chunk: {len(self.chunks)}")
+        return resolved_doc_id, new_chunks, np.vstack(parts)
+
+    def _append_document(self, doc_id: str, new_chunks: list, emb, replace: bool = False):
+        with self._writing():
+            # Yeni durum taslak üzerinde kurulur; yayınlanan durum hiç değişmez
+            state = self.state.draft()
+            if replace:
+                self._drop_rows(state, doc_id)
+
+            start = len(state.chunks)
+            if state.index is None:
+                state.alive = np.ones(len(emb), dtype=bool)
+                if self.storage == "float32":
+                    state.doc_embeddings = emb
+            else:
+                state.alive = np.concatenate([state.alive, np.ones(len(emb), dtype=bool)])
+                if self.storage == "float32":
+                    state.doc_embeddings = np.vstack([state.doc_embeddings, emb])
+
+            self._add_to_index(state, emb, start)
+            state.lexical = state.lexical.copy()
+            state.lexical.add(start, [c["text"] for c in new_chunks])
+            state.chunks.extend(new_chunks)
+            state.doc_rows.setdefault(doc_id, []).append((start, len(state.chunks)))
+            state.doc_hashes[doc_id] = state.compute_doc_hash(doc_id)
+            self.state = state
+
+    def _drop_rows(self, state: EngineState, doc_id: str) -> int:
+        # Taslak durumda satırlar tombstone olarak işaretlenir; ID eşlemeli indeksten
+        # vektörler yeniden kurmadan silinir (HNSW silmeyi desteklemez, orada aramada elenir)
+        ranges = state.doc_rows.pop(doc_id, None)
+        state.doc_hashes.pop(doc_id, None)
+        self.summaries.pop(doc_id, None)
+        if not ranges:
+            return 0
+
+        rows = np.concatenate([np.arange(start, end, dtype="int64") for start, end in ranges])
+        state.alive[rows] = False
+        index = base_index(state.index)
+        if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.Hashtable:
+            # Hashtable direct map yalnızca ID dizisiyle silebilir (ID başına hash araması)
+            state.writable_index().remove_ids(faiss.IDSelectorArray(rows))
+        elif not isinstance(index, faiss.IndexHNSW):
+            state.writable_index().remove_ids(faiss.IDSelectorBatch(rows))
+        return len(rows)
 
     # --------------------------------------------------
-    def _hybrid_context(self, question: str, top_k: int = 6, doc_id: str | None = None):
-        if self.index is None or self.doc_embeddings is None or len(self.chunks) == 0:
-            raise RuntimeError("Önce PDF yüklemelisiniz.")
-
-        query_vec = self.embed_model.encode(
-            [question],
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-        ).astype("float32")[0]
-
-        summary_mode = self._is_summary_question(question)
+    # SIKIŞTIRMA (tombstone satırları kaldır)
+    # --------------------------------------------------
+    def compact(self) -> int:
+        with self._writing():
+            old = self.state
+            # Silinmiş satır yoksa yalnızca indeks yeniden eğitilecekse kurulur
+            if old.alive is None or (old.alive.all() and not self._needs_retrain(old)):
+                return 0
+
+            keep = np.flatnonzero(old.alive)
+            removed = len(old.chunks) - len(keep)
+            if len(keep) == 0:
+                self.reset()
+                return removed
+
+            # Yeni durum yan tarafta kurulur, sonra tek atamayla yerine konur; sorgular
+            # sıkıştırma boyunca eski durumu okur
+            # Sıkıştırılmış depolamada vektörler indeksten çözülüp yeniden kodlanır
+            vectors = old.row_vectors(len(old.chunks))[keep]
+            alive = np.ones(len(keep), dtype=bool)
+            state = EngineState(
+                self._build_index(vectors, alive),
+                vectors if self.storage == "float32" else None,
+                [old.chunks[i] for i in keep],
+                alive,
+                old.lexical.compacted(old.alive),
+                doc_hashes=dict(old.doc_hashes),
+                trained_size=len(keep),
+            )
+            state.rebuild_doc_rows()
+            self.state = state
+
+        print(f"İndeks sıkıştırıldı: {removed} silinmiş chunk kaldırıldı ({len(keep)} chunk ile yeniden kuruldu).")
+        return removed
+
+    def needs_compaction(self) -> bool:
+        state = self.state
+        if not state.chunks:
+            return False
+        return state.tombstone_count() > COMPACT_RATIO * len(state.chunks) or self._needs_retrain(state)
+
+    def _needs_retrain(self, state: EngineState) -> bool:
+        # IVF merkezleri / PQ ve int8 kod kitapları ilk örnekle eğitilir; korpus o örneğin
+        # INDEX_RETRAIN_FACTOR katına büyüyünce (IVF'te liste başına tarama da o oranda
+        # büyür) yeniden kurulur. Geçici (flat / float16) indeksler zaten eklemede kurulur
+        if state.index is None or not state.trained_size or self._index_pending(state.index):
+            return False
+        trained = isinstance(base_index(state.index), faiss.IndexIVF) or index_storage(state.index) == "int8"
+        return trained and state.chunk_count() >= INDEX_RETRAIN_FACTOR * state.trained_size
+
+    def compact_in_background(self, on_done=None) -> bool:
+        with self._compact_lock:
+            if self._compacting or not self.needs_compaction():
+                return False
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+                if on_done:
+                    on_done()
+            except Exception as e:
+                print(f"İndeks sıkıştırma hatası: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="rag-compact", daemon=True).start()
+        return True
+
+    def _storage_for(self, n_live: int) -> str:
+        # int8 aralıkları birkaç chunk'la öğrenilirse sonraki dokümanlar kırpılır;
+        # yeterli vektör birikene kadar float16 kullanılır
+        if self.storage == "int8" and n_live < SQ_MIN_TRAIN:
+            return "float16"
+        return self.storage
+
+    def _index_pending(self, index) -> bool:
+        # IVF/PQ ya da int8 seçili ama yeterli vektör olmadığı için henüz geçici
+        # (flat / float16) indeks kullanılıyor
+        if self.index_type in ("ivf", "ivfpq"):
+            return not isinstance(base_index(index), faiss.IndexIVF)
+        return index_storage(index) != self.storage
+
+    def _build_index(self, vectors, alive):
+        # FAISS ID'si = chunks satır numarası; yalnızca canlı satırlar eklenir
+        ids = np.flatnonzero(alive).astype("int64")
+        live = vectors[ids]
+        index_type = self.index_type
+        if index_type in ("ivf", "ivfpq") and len(live) < min_train_size(index_type):
+            index_type = "flat"
+
+        index = make_index(index_type, vectors.shape[1], live, self._storage_for(len(live)))
+        # IVF ID'leri kendi listelerinde tutar ve remove_ids'te iç sırayı kaydırmaz;
+        # IndexIDMap ise alt indeksin flat gibi sıkıştığını varsayar, o yüzden sarılmaz
+        if isinstance(index, faiss.IndexIVF):
+            if self.storage != "float32":
+                # Vektörlerin tek kopyası indekste: ID ile çözebilmek için direct map
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        else:
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(live, ids)
+        return index
+
+    def _rebuild_index(self, state: EngineState):
+        vectors = state.row_vectors(len(state.chunks))
+        state.doc_embeddings = vectors if self.storage == "float32" else None
+        state.index = self._build_index(vectors, state.alive)
+        state.trained_size = int(state.alive.sum())
+
+    def _add_to_index(self, state: EngineState, emb, start: int):
+        # Taslak durumda alive (float32 depolamada doc_embeddings de) yeni satırları
+        # zaten içeriyor olmalı
+        if state.index is None or self._index_pending(state.index):
+            live = int(state.alive.sum())
+            threshold = min_train_size(self.index_type) if self.index_type in ("ivf", "ivfpq") else SQ_MIN_TRAIN
+            if state.index is None or live >= threshold:
+                if state.doc_embeddings is not None:
+                    vectors = state.doc_embeddings
+                elif start == 0:
+                    vectors = emb
+                else:
+                    vectors = np.vstack([state.row_vectors(start), emb])
+                state.index = self._build_index(vectors, state.alive)
+                state.trained_size = live
+                return
+        state.writable_index().add_with_ids(emb, np.arange(start, start + len(emb), dtype="int64"))
+
+    def _encode_passages(self, chunks: list):
+        texts = [c["text"] for c in chunks]
+        if self.embed_cache is None:
+            return self._encode_texts(texts)
+
+        # Yalnızca cache'te olmayan chunk'lar modelden geçer
+        cached = self.embed_cache.get_many(texts)
+        misses = [i for i, v in enumerate(cached) if v is None]
+        if misses:
+            fresh = self._encode_texts([texts[i] for i in misses])
+            self.embed_cache.put_many([texts[i] for i in misses], fresh)
+            for i, vec in zip(misses, fresh):
+                cached[i] = vec
+        return np.vstack(cached).astype("float32", copy=False)
+
+    def warm_up(self):
+        # İlk gerçek istek model / tokenizer / thread havuzu başlatma maliyetini ödemesin
+        self._encode_queries(["ısınma sorusu"])
+        self._encode_texts(["ısınma metni"] * 8)
+        self.count_tokens("ısınma metni")
+
+    def _encode_texts(self, texts: list):
+        return self.encoder.encode(texts)
+
+    def _encode_queries(self, questions: list):
+        return self.encoder.encode(questions, batch_size=len(questions))
 
-        search_k = (
-            min(len(self.chunks), max(16, top_k * 4))
-            if summary_mode
-            else min(len(self.chunks), max(12, top_k * 2))
+    # --------------------------------------------------
+    def _resolve_doc_ids(self, doc_id) -> list | None:
+        if not doc_id:
+            return None
+        doc_ids = [doc_id] if isinstance(doc_id, str) else [d for d in doc_id if d]
+        return list(dict.fromkeys(doc_ids)) or None
+
+    def _doc_row_count(self, state: EngineState, doc_ids: list) -> int:
+        return sum(end - start for d in doc_ids for start, end in state.doc_rows.get(d, []))
+
+    def _search_docs(self, state: EngineState, query_vecs, doc_ids: list, k: int) -> list:
+        # Ön filtre: yalnızca seçili dokümanların satırları taranır (birebir arama),
+        # maliyet tüm korpusla değil hedef doküman(lar)ın boyutuyla ölçeklenir.
+        # query_vecs (sorgu x boyut); her sorgu için en yakın k satır döner
+        ranges = [r for d in doc_ids for r in state.doc_rows.get(d, [])]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        vectors = state.vectors
+        scores = np.concatenate([vectors[start:end] @ query_vecs.T for start, end in ranges])
+
+        if k < len(rows):
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        else:
+            top = np.tile(np.arange(len(rows))[:, None], (1, scores.shape[1]))
+        results = []
+        for j in range(scores.shape[1]):
+            col = top[:, j]
+            col = col[np.argsort(-scores[col, j], kind="stable")]
+            results.append([int(r) for r in rows[col]])
+        return results
+
+    def _search_index(self, state: EngineState, query_vecs, pool: int, k: int, nprobe, ef_search) -> list:
+        # Tüm sorgular tek FAISS çağrısında aranır. Silmeyi desteklemeyen indekste (HNSW)
+        # tombstone'lar kadar fazla istenip elenir
+        stale = state.index.ntotal - pool
+        _, indices = state.index.search(
+            np.ascontiguousarray(query_vecs, dtype="float32"),
+            k=k + stale,
+            params=search_params(state.index, nprobe=nprobe, ef_search=ef_search),
         )
-        scores, indices = self.index.search(np.array([query_vec]), k=search_k)
-        candidate_pairs = [
-            (int(idx), float(score))
-            for idx, score in zip(indices[0], scores[0])
-            if int(idx) >= 0
-        ]
-        candidates = [idx for idx, _ in candidate_pairs]
+        return [[int(idx) for idx in row if int(idx) >= 0 and state.alive[idx]][:k] for row in indices]
+
+    def _search_k(self, pool: int, top_k: int, summary_mode: bool) -> int:
+        if summary_mode:
+            return min(pool, max(16, top_k * 4))
+        return min(pool, max(12, top_k * 2))
 
-        if doc_id:
-            candidates = [idx for idx in candidates if self.chunks[idx]["doc_id"] == doc_id]
-            if not candidates:
-                raise RuntimeError(f"Secili dokuman icin uygun baglam bulunamadi: {doc_id}")
+    def _refine_candidates(
+        self,
+        state: EngineState,
+        question: str,
+        candidates: list,
+        doc_ids,
+        search_k: int,
+        top_k: int,
+        summary_mode: bool,
+        rerank_budget_ms,
+    ):
+        # Yoğun aday listesine sözcük araması ve reranker uygulanır; (adaylar, alaka, top_k)
+        # Tam kimlik / sayı / özel isim eşleşmeleri için BM25 sonuçları yoğun sıralamayla
+        # RRF ile birleştirilir; birleşik skor MMR'da alaka olarak kullanılır
+        relevance = None
+        if LEXICAL_SEARCH and not summary_mode:
+            ranges = [r for d in doc_ids for r in state.doc_rows.get(d, [])] if doc_ids else None
+            lexical_rows, _ = state.lexical.search(question, search_k, ranges=ranges, alive=state.alive)
+            if len(lexical_rows):
+                candidates, relevance = rrf_fuse([candidates, lexical_rows], search_k, rrf_k=RRF_K)
+
+        # İsteğe bağlı cross-encoder: adaylar tek batch'te yeniden puanlanır; bütçe
+        # yetmezse ilk aşama sırasına göre kesilir ya da hiç çalışmaz
+        if self.reranker is not None and not summary_mode and candidates:
+            rerank_scores = self.reranker.rerank(
+                question,
+                [state.chunks[i]["text"] for i in candidates],
+                budget_ms=rerank_budget_ms,
+            )
+            if rerank_scores is not None:
+                candidates = candidates[: len(rerank_scores)]
+                relevance = rerank_scores
+                top_k = min(top_k, RERANK_TOP_K)
 
         if not candidates:
             raise RuntimeError("Uygun bağlam bulunamadı.")
+        return candidates, relevance, top_k
 
+    def _mmr_params(self, candidates: list, top_k: int, summary_mode: bool):
+        # (seçilecek chunk sayısı, lam, bağlam token bütçesi)
         if summary_mode:
             summary_k = min(len(candidates), max(1, top_k))
-            selected_indices = mmr_select(
-                query_vec,
-                self.doc_embeddings,
-                candidates.copy(),
-                k=summary_k,
-                lam=0.82,
-            )
-            max_chars = min(12000, max(MAX_SUMMARY_CONTEXT_CHARS, summary_k * 900))
-        else:
-            selected_indices = mmr_select(
-                query_vec,
-                self.doc_embeddings,
-                candidates,
-                k=min(top_k, len(candidates)),
-            )
-            max_chars = MAX_CONTEXT_CHARS
+            max_tokens = min(MAX_SUMMARY_TOKENS_CAP, max(MAX_SUMMARY_CONTEXT_TOKENS, summary_k * SUMMARY_TOKENS_PER_CHUNK))
+            return summary_k, 0.82, max_tokens
+        return min(top_k, len(candidates)), 0.65, MAX_CONTEXT_TOKENS
 
-        selected_chunks = [self.chunks[i] for i in selected_indices]
+    def _pack_selected(self, state: EngineState, selected_indices: list, max_tokens: int):
+        selected_chunks = [state.chunks[i] for i in selected_indices]
 
-        context_parts = []
-        total = 0
-        for c in selected_chunks:
-            t = c["text"]
-            if total + len(t) > max_chars:
-                break
-            context_parts.append(t)
-            total += len(t)
+        # Komşu chunk'lar örtüşmesiz birleştirilip token bütçesine paketlenir
+        with PROMPT_BUILD_SECONDS.time():
+            context, used_chunks = pack_context(selected_chunks, max_tokens, self.count_tokens)
+        sources = [{"dosya": c["doc_id"], "parca": c["chunk_id"]} for c in used_chunks]
+        return context, sources
 
-        context = "\n\n".join(context_parts)
-        sources = [{"dosya": c["doc_id"], "parca": c["chunk_id"]} for c in selected_chunks]
+    def _hybrid_context(
+        self,
+        question: str,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+        query_vec=None,
+    ):
+        # Sorgu boyunca aynı durum kullanılır; eşzamanlı ingest / silme / sıkıştırma
+        # yeni durumu yayınlasa da satırlar, vektörler ve chunk'lar birbiriyle tutarlı kalır
+        state = self.state
+        if state.index is None or not state.doc_rows:
+            raise RuntimeError("Önce PDF yüklemelisiniz.")
 
-        return context, sources
+        if query_vec is None:
+            with QUERY_EMBED_SECONDS.time():
+                query_vec = self.query_batcher.encode(question)
+
+        summary_mode = self._is_summary_question(question)
+        doc_ids = self._resolve_doc_ids(doc_id)
+
+        pool = self._doc_row_count(state, doc_ids) if doc_ids else state.chunk_count()
+        if doc_ids and pool == 0:
+            raise RuntimeError(f"Secili dokuman icin uygun baglam bulunamadi: {', '.join(doc_ids)}")
+
+        search_k = self._search_k(pool, top_k, summary_mode)
+        query_vecs = np.asarray(query_vec, dtype="float32")[None, :]
+        with SEARCH_SECONDS.time():
+            if doc_ids:
+                candidates = self._search_docs(state, query_vecs, doc_ids, search_k)[0]
+            else:
+                candidates = self._search_index(state, query_vecs, pool, search_k, nprobe, ef_search)[0]
+
+        candidates, relevance, top_k = self._refine_candidates(
+            state, question, candidates, doc_ids, search_k, top_k, summary_mode, rerank_budget_ms
+        )
+        k, lam, max_tokens = self._mmr_params(candidates, top_k, summary_mode)
+        with MMR_SECONDS.time():
+            selected_indices = mmr_select(query_vec, state.vectors, candidates, k=k, lam=lam, relevance=relevance)
+        return self._pack_selected(state, selected_indices, max_tokens)
+
+    def _hybrid_contexts(
+        self,
+        questions: list,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+    ) -> list:
+        # _hybrid_context'in soru listesi hali: tek encode, tek FAISS araması, tek MMR turu.
+        # Soru başına (bağlam, kaynaklar) ya da hata (Exception) döner
+        state = self.state
+        if state.index is None or not state.doc_rows:
+            raise RuntimeError("Önce PDF yüklemelisiniz.")
+
+        doc_ids = self._resolve_doc_ids(doc_id)
+        pool = self._doc_row_count(state, doc_ids) if doc_ids else state.chunk_count()
+        if doc_ids and pool == 0:
+            raise RuntimeError(f"Secili dokuman icin uygun baglam bulunamadi: {', '.join(doc_ids)}")
+
+        with QUERY_EMBED_SECONDS.time():
+            query_vecs = np.asarray(self._encode_queries(questions), dtype="float32")
+        summary_modes = [self._is_summary_question(q) for q in questions]
+        search_ks = [self._search_k(pool, top_k, mode) for mode in summary_modes]
+        # Herkes için en geniş k ile aranır, sonra soru başına kesilir
+        with SEARCH_SECONDS.time():
+            if doc_ids:
+                dense = self._search_docs(state, query_vecs, doc_ids, max(search_ks))
+            else:
+                dense = self._search_index(state, query_vecs, pool, max(search_ks), nprobe, ef_search)
+
+        results = [None] * len(questions)
+        plans = []
+        for i, question in enumerate(questions):
+            try:
+                candidates, relevance, k_top = self._refine_candidates(
+                    state, question, dense[i][: search_ks[i]], doc_ids, search_ks[i], top_k, summary_modes[i], rerank_budget_ms
+                )
+            except Exception as e:
+                results[i] = e
+                continue
+            k, lam, max_tokens = self._mmr_params(candidates, k_top, summary_modes[i])
+            plans.append((i, candidates, relevance, k, lam, max_tokens))
+
+        if plans:
+            with MMR_SECONDS.time():
+                selected = mmr_select_many(
+                    query_vecs[[p[0] for p in plans]],
+                    state.vectors,
+                    [p[1] for p in plans],
+                    ks=[p[3] for p in plans],
+                    lams=[p[4] for p in plans],
+                    relevances=[p[2] for p in plans],
+                )
+            for (i, *_, max_tokens), selected_indices in zip(plans, selected):
+                results[i] = self._pack_selected(state, selected_indices, max_tokens)
+        return results
 
     # --------------------------------------------------
     def _build_prompt(self, context: str, question: str):
@@ -428,9 +1867,29 @@ CEVAP:
 """.strip()
 
     # --------------------------------------------------
-    def ask(self, question: str, top_k: int = 6, doc_id: str | None = None):
+    def ask(
+        self,
+        question: str,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+    ):
         try:
-            context, sources = self._hybrid_context(question, top_k=top_k, doc_id=doc_id)
+            if self._is_summary_question(question):
+                cached = self._summary_answer(question, doc_id)
+                if cached is not None:
+                    return {"cevap": cached[0], "kaynaklar": cached[1]}
+
+            context, sources = self._hybrid_context(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            )
             prompt = self._build_prompt(context, question)
             is_summary = self._is_summary_question(question)
 
@@ -447,6 +1906,299 @@ CEVAP:
         except Exception as e:
             return {"hata": str(e)}
 
+    # --------------------------------------------------
+    # TOPLU SORU (değerlendirme, SSS üretimi)
+    # --------------------------------------------------
+    def _batch_contexts(self, questions: list, doc_id=None, **search) -> list:
+        # Blok içindeki her soru için: {"doc_ids": [...]} (önbellekli özetten cevaplanacak),
+        # (bağlam, kaynaklar) ya da hata (Exception). Önbellek kararı burada bir kez verilir;
+        # cevap adımında yeniden sorulursa araya giren bir arka plan çıkarımı kararı değiştirebilir
+        items = [None] * len(questions)
+        rest = []
+        for i, question in enumerate(questions):
+            doc_ids = self._summary_doc_ids(question, doc_id)
+            if doc_ids is None:
+                rest.append(i)
+            else:
+                items[i] = {"doc_ids": doc_ids}
+        if rest:
+            try:
+                contexts = self._hybrid_contexts([questions[i] for i in rest], doc_id=doc_id, **search)
+            except Exception as e:
+                contexts = [e] * len(rest)
+            for i, item in zip(rest, contexts):
+                items[i] = item
+        return items
+
+    def _batch_prompt(self, question: str, context: str) -> dict:
+        is_summary = self._is_summary_question(question)
+        return {
+            "prompt": self._build_prompt(context, question),
+            "max_tokens": MAX_TOKENS_SUMMARY if is_summary else MAX_TOKENS_QA,
+            "temperature": 0.15 if is_summary else 0.0,
+        }
+
+    def _batch_result(self, index: int, question: str, answer: str, sources: list) -> dict:
+        if self._is_summary_question(question):
+            answer = self._postprocess_summary(answer)
+        return {"index": index, "cevap": answer.strip(), "kaynaklar": sources}
+
+    def _batch_answer(self, index: int, question: str, item) -> dict:
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, dict):
+                answer, sources = self._answer_from_summaries(question, item["doc_ids"])
+                return {"index": index, "cevap": answer, "kaynaklar": sources}
+
+            context, sources = item
+            return self._batch_result(index, question, call_llm(**self._batch_prompt(question, context)), sources)
+        except Exception as e:
+            return {"index": index, "hata": str(e)}
+
+    def ask_many(
+        self,
+        questions: list,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+        concurrency: int = ASK_BATCH_LLM_CONCURRENCY,
+    ):
+        # Sonuçlar tamamlandıkça (soru sırasından bağımsız) üretilir:
+        # {"index": i, "cevap": ..., "kaynaklar": [...]} ya da {"index": i, "hata": ...}
+        search = {"top_k": top_k, "nprobe": nprobe, "ef_search": ef_search, "rerank_budget_ms": rerank_budget_ms}
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="rag-batch")
+        try:
+            pending = set()
+            for start in range(0, len(questions), ASK_BATCH_BLOCK):
+                block = questions[start : start + ASK_BATCH_BLOCK]
+                items = self._batch_contexts(block, doc_id, **search)
+                for i, (question, item) in enumerate(zip(block, items), start):
+                    pending.add(pool.submit(self._batch_answer, i, question, item))
+
+                done = {f for f in pending if f.done()}
+                pending -= done
+                for f in done:
+                    yield f.result()
+
+            for f in as_completed(pending):
+                yield f.result()
+        finally:
+            # Tüketici erken bırakırsa sıradaki LLM çağrıları yapılmaz
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # --------------------------------------------------
+    # ASYNC (event loop'u bloklamadan)
+    # --------------------------------------------------
+    async def run_blocking(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def _ahybrid_context(self, question: str, **kwargs):
+        # Embedding batcher'da executor thread'i tutmadan beklenir; böylece eşzamanlı
+        # sorular CPU_WORKERS sınırına takılmadan aynı batch'e girer
+        if self.state.index is None:
+            raise RuntimeError("Önce PDF yüklemelisiniz.")
+        started = time.perf_counter()
+        query_vec = await asyncio.wrap_future(self.query_batcher.submit(question))
+        QUERY_EMBED_SECONDS.observe(time.perf_counter() - started)
+        return await self.run_blocking(self._hybrid_context, question, query_vec=query_vec, **kwargs)
+
+    async def _aensure_summary_tree(self, doc_id: str):
+        tree = self._cached_summary_tree(doc_id)
+        if tree:
+            return tree
+
+        fut, owner = self._claim_summary_build(doc_id)
+        if not owner:
+            # shield: bu istek iptal edilirse ortak future iptal edilmez, sahibi sonucu yine yazar
+            return await asyncio.shield(asyncio.wrap_future(fut))
+
+        try:
+            tree = self._cached_summary_tree(doc_id) or await self._amap_reduce_summary(doc_id)
+        except BaseException as e:
+            # İptal edilse de (istemci koptu) bekleyenler serbest bırakılır
+            error = e if isinstance(e, Exception) else RuntimeError("Özet çıkarımı iptal edildi.")
+            self._finish_summary_build(doc_id, fut, error=error)
+            raise
+        self._finish_summary_build(doc_id, fut, tree=tree)
+        return tree
+
+    async def _amap_reduce_summary(self, doc_id: str):
+        doc_hash, sections = await self.run_blocking(self._plan_summary_sections, doc_id)
+        limit = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+
+        async def summarize(sec):
+            async with limit:
+                return await acall_llm(
+                    self._build_section_prompt(sec["text"]),
+                    max_tokens=MAX_TOKENS_SECTION,
+                    temperature=0.0,
+                )
+
+        section_summaries = await asyncio.gather(*(summarize(sec) for sec in sections))
+        raw = await acall_llm(
+            self._build_reduce_prompt(section_summaries),
+            max_tokens=MAX_TOKENS_SUMMARY,
+            temperature=0.15,
+        )
+        return self._store_summary_tree(doc_id, doc_hash, sections, section_summaries, raw)
+
+    async def _asummary_answer(self, question: str, doc_id=None):
+        doc_ids = self._summary_doc_ids(question, doc_id)
+        if doc_ids is None:
+            return None
+        return await self._aanswer_from_summaries(question, doc_ids)
+
+    async def _aanswer_from_summaries(self, question: str, doc_ids: list):
+        trees = {d: await self._aensure_summary_tree(d) for d in doc_ids}
+        kind, payload, sources = self._summary_from_trees(question, trees)
+        if kind == "prompt":
+            payload = self._postprocess_summary(
+                await acall_llm(payload, max_tokens=MAX_TOKENS_SUMMARY, temperature=0.15)
+            )
+        return payload, sources
+
+    async def abuild_from_pdf(self, pdf_path, doc_id: str | None = None, progress=None):
+        await self.run_blocking(self.build_from_pdf, pdf_path, doc_id=doc_id, progress=progress)
+
+    async def aask(
+        self,
+        question: str,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+    ):
+        try:
+            if self._is_summary_question(question):
+                cached = await self._asummary_answer(question, doc_id)
+                if cached is not None:
+                    return {"cevap": cached[0], "kaynaklar": cached[1]}
+
+            context, sources = await self._ahybrid_context(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            )
+            prompt = self._build_prompt(context, question)
+            is_summary = self._is_summary_question(question)
+
+            answer = await acall_llm(
+                prompt,
+                max_tokens=MAX_TOKENS_SUMMARY if is_summary else MAX_TOKENS_QA,
+                temperature=0.15 if is_summary else 0.0,
+            )
+
+            if is_summary:
+                answer = self._postprocess_summary(answer)
+
+            return {"cevap": answer.strip(), "kaynaklar": sources}
+        except Exception as e:
+            return {"hata": str(e)}
+
+    async def aask_stream(
+        self,
+        question: str,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+    ):
+        # ask_stream ile aynı olaylar
+        try:
+            if self._is_summary_question(question):
+                cached = await self._asummary_answer(question, doc_id)
+                if cached is not None:
+                    yield {"token": cached[0]}
+                    yield {"kaynaklar": cached[1]}
+                    return
+
+            context, sources = await self._ahybrid_context(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            )
+            prompt = self._build_prompt(context, question)
+
+            if self._is_summary_question(question):
+                answer = await acall_llm(prompt, max_tokens=MAX_TOKENS_SUMMARY, temperature=0.15)
+                yield {"token": self._postprocess_summary(answer)}
+            else:
+                async for token in astream_llm(prompt, max_tokens=MAX_TOKENS_QA, temperature=0.0):
+                    yield {"token": token}
+
+            yield {"kaynaklar": sources}
+        except Exception as e:
+            yield {"hata": str(e)}
+
+    async def _abatch_answer(self, index: int, question: str, item) -> dict:
+        try:
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, dict):
+                answer, sources = await self._aanswer_from_summaries(question, item["doc_ids"])
+                return {"index": index, "cevap": answer, "kaynaklar": sources}
+
+            context, sources = item
+            return self._batch_result(index, question, await acall_llm(**self._batch_prompt(question, context)), sources)
+        except Exception as e:
+            return {"index": index, "hata": str(e)}
+
+    async def aask_many(
+        self,
+        questions: list,
+        top_k: int = 6,
+        doc_id: str | list[str] | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_budget_ms: float | None = None,
+        concurrency: int = ASK_BATCH_LLM_CONCURRENCY,
+    ):
+        # ask_many ile aynı olaylar. Bloklar executor'da hazırlanırken önceki blokların
+        # LLM çağrıları event loop'ta, en fazla concurrency tanesi aynı anda sürer
+        search = {"top_k": top_k, "nprobe": nprobe, "ef_search": ef_search, "rerank_budget_ms": rerank_budget_ms}
+        limit = asyncio.Semaphore(max(1, concurrency))
+        results = asyncio.Queue()
+        tasks = []
+
+        async def answer(index, question, item):
+            async with limit:
+                results.put_nowait(await self._abatch_answer(index, question, item))
+
+        async def produce():
+            start = 0
+            try:
+                for start in range(0, len(questions), ASK_BATCH_BLOCK):
+                    block = questions[start : start + ASK_BATCH_BLOCK]
+                    items = await self.run_blocking(self._batch_contexts, block, doc_id, **search)
+                    tasks.extend(
+                        asyncio.create_task(answer(i, question, item))
+                        for i, (question, item) in enumerate(zip(block, items), start)
+                    )
+            except Exception as e:
+                # Hazırlanamayan soruların her biri hata olarak bildirilir
+                for i in range(start, len(questions)):
+                    results.put_nowait({"index": i, "hata": str(e)})
+
+        tasks.append(asyncio.create_task(produce()))
+        try:
+            for _ in range(len(questions)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
 
 # --------------------------------------------------
 # TEST
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Boşsa rerank kapalı; örn. çok dilli "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+# İstek başına rerank süresi bütçesi (ms); tahmini süre aşarsa aday sayısı kısılır
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "150"))
+# Bundan az aday sığıyorsa rerank tamamen atlanır
+RERANK_MIN_CANDIDATES = 3
+# Tek seferde değerlendirilecek en fazla aday
+RERANK_MAX_CANDIDATES = int(os.getenv("RAG_RERANK_MAX_CANDIDATES", "32"))
+
+
+# --------------------------------------------------
+# CROSS-ENCODER RERANK (CPU)
+# --------------------------------------------------
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, budget_ms: float = RERANK_BUDGET_MS):
+        print(f"Rerank modeli yükleniyor (cpu): {model_name}")
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        # Rerank kapalıyken sentence_transformers import edilmez
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.over_budget = 0
+        self.total_ms = 0.0
+        # Aday (soru, chunk) çifti başına süre tahmini; ölçümlerle güncellenir
+        self.pair_ms = None
+
+        # Isınma: ilk istek model başlatma maliyetini ödemesin, süre tahmini de dolsun
+        for _ in range(2):
+            self.rerank("ısınma", ["ısınma metni"] * RERANK_MAX_CANDIDATES, budget_ms=float("inf"))
+        self.calls = 0
+        self.total_ms = 0.0
+
+    def plan(self, n: int, budget_ms: float | None = None) -> int:
+        # Bütçeye sığan aday sayısı; 0 ise rerank atlanır
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        if budget_ms <= 0:
+            return 0
+        n = min(n, RERANK_MAX_CANDIDATES)
+        if self.pair_ms and budget_ms != float("inf"):
+            n = min(n, int(budget_ms / self.pair_ms))
+        return n if n >= RERANK_MIN_CANDIDATES else 0
+
+    def rerank(self, question: str, texts: list, budget_ms: float | None = None):
+        # İlk n metnin alaka skorları (0-1 arası, en iyisi 1) ya da bütçe yetmezse None.
+        # Metinler ilk aşama sırasıyla gelmeli; kesme sondan yapılır.
+        n = self.plan(len(texts), budget_ms)
+        if n == 0:
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        start = time.perf_counter()
+        scores = np.asarray(
+            self.model.predict(
+                [(question, t) for t in texts[:n]],
+                batch_size=n,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            ),
+            dtype=np.float64,
+        ).reshape(n, -1)[:, -1]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.truncated += n < len(texts)
+            limit = self.budget_ms if budget_ms is None else budget_ms
+            self.over_budget += elapsed_ms > limit
+            per_pair = elapsed_ms / n
+            self.pair_ms = per_pair if self.pair_ms is None else 0.8 * self.pair_ms + 0.2 * per_pair
+
+        low, high = scores.min(), scores.max()
+        if high > low:
+            return (scores - low) / (high - low)
+        return np.ones(n, dtype=np.float64)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "budget_ms": self.budget_ms,
+                "calls": self.calls,
+                "skipped": self.skipped,
+                "truncated": self.truncated,
+                "over_budget": self.over_budget,
+                "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+                "pair_ms": round(self.pair_ms, 3) if self.pair_ms else None,
+            }
+
+
+def open_reranker():
+    if not RERANK_MODEL:
+        return None
+    return CrossEncoderReranker(RERANK_MODEL)
@@ -1,45 +1,444 @@
+import json
 import logging
 import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse, StreamingResponse
-from rag_core import RAGEngine
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from llm_client import aclose_llm_client, get_model_router
+from metrics import CONTENT_TYPE, render_metrics
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from shared_index import SHARED_INDEX_DIR
 
-app = FastAPI(title="Local RAG (HF + FAISS + MPS)")
+# rag_core (faiss, torch / onnxruntime) burada import edilmez: model yükleme ve default
+# PDF ingest'i arka planda yapılır, sunucu hemen bağlantı kabul eder
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=start_engine, name="rag-startup", daemon=True).start()
+    yield
+    await aclose_llm_client()
+
+
+app = FastAPI(title="Local RAG (HF + FAISS + MPS)", lifespan=lifespan)
 logger = logging.getLogger(__name__)
 
-engine = RAGEngine()
+# Motor hazır olana kadar None; durum: starting -> loading -> ingesting -> ready | failed
+engine = None
+startup = {"status": "starting", "error": None, "started_at": time.time(), "ready_at": None}
+# Motor hazır olmadan da cevap veren yollar
+STARTUP_EXEMPT_PATHS = {"/healthz", "/readyz", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
 DEFAULT_PDF = os.getenv("RAG_PDF", "")
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "")
+# Aynı anda çalışan ingest sayısı; fazlası kuyrukta bekler
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "1"))
+# Bellekte tutulan en fazla bitmiş iş kaydı (eskiler silinir; kuyruktaki / süren işler silinmez)
+JOB_HISTORY = 200
+JOB_FINISHED_STATUSES = ("done", "failed")
+# Yüklenen PDF'ler ingest bitene kadar burada geçici dosya olarak durur
+UPLOAD_DIR = os.getenv("RAG_UPLOAD_DIR", "") or tempfile.gettempdir()
+MAX_UPLOAD_MB = float(os.getenv("RAG_MAX_UPLOAD_MB", "100"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Ortak indeks modunda (birden çok worker) iş durumları burada dosya olarak tutulur:
+# iş hangi worker'da çalışırsa çalışsın her worker'dan sorgulanabilir
+JOB_DIR = os.path.join(SHARED_INDEX_DIR, "jobs") if SHARED_INDEX_DIR else ""
+# Ortak iş dosyasının ilerleme sırasında en sık yazılma aralığı (sn)
+JOB_WRITE_INTERVAL_S = 1.0
+# /ask-batch isteğinde kabul edilen en fazla soru
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("RAG_ASK_BATCH_MAX_QUESTIONS", "500"))
+
+
+def persist_index():
+    # Ortak modda her yazma zaten yeni sürüm olarak yayınlanır
+    if not INDEX_DIR or engine.shared is not None:
+        return
+    try:
+        if engine.state.index is None:
+            shutil.rmtree(INDEX_DIR, ignore_errors=True)
+        else:
+            engine.save(INDEX_DIR)
+    except Exception:
+        logger.exception("Snapshot save failed")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+async def receive_upload(request: Request, max_bytes: int) -> tuple:
+    # multipart gövde FastAPI'ye bırakılmadan akış halinde çözülür: "file" alanı doğrudan
+    # UPLOAD_DIR'deki nihai dosyaya yazılır (ara spool / ikinci kopya yok). Content-Length
+    # olmayan (chunked) isteklerde de sınır, gövde okunurken aşıldığı anda uygulanır.
+    # (dosya yolu, dosya adı) döner
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("multipart/form-data bekleniyor.")
+
+    part = {"headers": {}, "field": b"", "value": b"", "is_file": False}
+    found = {"file": False, "filename": None}
+    pending = bytearray()
+
+    def on_part_begin():
+        part.update(headers={}, field=b"", value=b"", is_file=False)
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["is_file"] = disposition.get(b"name") == b"file" and not found["file"]
+        if part["is_file"]:
+            found["file"] = True
+            found["filename"] = disposition.get(b"filename", b"").decode("utf-8", errors="replace")
+
+    def on_part_data(data, start, end):
+        if part["is_file"]:
+            pending.extend(data[start:end])
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        },
+    )
+
+    fd, path = tempfile.mkstemp(prefix="rag-upload-", suffix=".pdf", dir=UPLOAD_DIR)
+    try:
+        received = written = 0
+        with os.fdopen(fd, "wb") as dst:
+            async for block in request.stream():
+                received += len(block)
+                # Dosya dışı alanlar ve multipart başlıkları için küçük pay
+                if received > max_bytes + UPLOAD_CHUNK_BYTES:
+                    raise UploadTooLarge()
+                try:
+                    parser.write(block)
+                except MultipartParseError as e:
+                    raise InvalidUpload(f"Geçersiz multipart gövde: {e}")
+                if len(pending) > max_bytes - written:
+                    raise UploadTooLarge()
+                if len(pending) >= UPLOAD_CHUNK_BYTES:
+                    written += len(pending)
+                    await engine.run_blocking(dst.write, bytes(pending))
+                    pending.clear()
+            try:
+                parser.finalize()
+            except MultipartParseError as e:
+                raise InvalidUpload(f"Geçersiz multipart gövde: {e}")
+            if pending:
+                await engine.run_blocking(dst.write, bytes(pending))
+
+        if not found["file"]:
+            raise InvalidUpload("Formda 'file' alanı yok.")
+        return path, found["filename"]
+    except BaseException:
+        remove_file(path)
+        raise
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 
 # --------------------------------------------------
-# Sunucu başlarken default PDF yükle
+# Sunucu başlarken (arka planda) model yükle, snapshot'tan aç, yoksa default PDF yükle
 # --------------------------------------------------
-if os.path.exists(DEFAULT_PDF):
-    print("Default PDF yükleniyor...")
-    engine.build_from_pdf(DEFAULT_PDF)
-    print("Yüklendi. Chunk:", len(engine.chunks))
+def start_engine():
+    global engine
+    try:
+        startup["status"] = "loading"
+        from rag_core import RAGEngine
+
+        loaded = RAGEngine()
+        if INDEX_DIR and not SHARED_INDEX_DIR and os.path.exists(os.path.join(INDEX_DIR, "meta.json")):
+            try:
+                loaded.load(INDEX_DIR)
+            except Exception:
+                logger.exception("Snapshot load failed, rebuilding")
+                loaded.reset()
+        loaded.warm_up()
+        engine = loaded
+
+        if os.path.exists(DEFAULT_PDF):
+            default_doc_id = os.path.basename(DEFAULT_PDF)
+            if default_doc_id not in engine.state.doc_rows:
+                startup["status"] = "ingesting"
+                print("Default PDF yükleniyor...")
+                if engine.shared is not None:
+                    # Worker'lar aynı anda başlar; ikinci yükleme kopya eklemek yerine değiştirir
+                    engine.replace_document(default_doc_id, DEFAULT_PDF)
+                else:
+                    engine.build_from_pdf(DEFAULT_PDF)
+                print("Yüklendi. Chunk:", engine.chunk_count())
+                persist_index()
+
+        startup["ready_at"] = time.time()
+        startup["status"] = "ready"
+        print(f"Sunucu hazır ({startup['ready_at'] - startup['started_at']:.1f} sn).")
+    except Exception as e:
+        logger.exception("Engine startup failed")
+        startup["error"] = str(e)
+        startup["status"] = "failed"
+
+
+@app.middleware("http")
+async def require_engine(request: Request, call_next):
+    # Motor hazır değilken istekler 503 ile geri çevrilir (yük dengeleyici /readyz'e bakar)
+    if startup["status"] != "ready" and request.url.path not in STARTUP_EXEMPT_PATHS:
+        message = "Sunucu başlatılamadı." if startup["status"] == "failed" else "Sunucu hazırlanıyor."
+        return JSONResponse(
+            {"error": message, "status": startup["status"]},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+    return await call_next(request)
+
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: süreç ayakta; başlatma kalıcı olarak başarısızsa yeniden başlatılsın
+    if startup["status"] == "failed":
+        return JSONResponse({"status": "failed", "error": startup["error"]}, status_code=500)
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: model yüklü, ısınmış ve default PDF indekslenmiş
+    body = {"ready": startup["status"] == "ready", "status": startup["status"]}
+    if startup["ready_at"]:
+        body["startup_s"] = round(startup["ready_at"] - startup["started_at"], 2)
+    if not body["ready"]:
+        return JSONResponse(body, status_code=503)
+    return body
 
 
 # --------------------------------------------------
 # PDF Upload
 # --------------------------------------------------
-@app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
-    try:
-        name = f"uploaded_{uuid.uuid4().hex}.pdf"
-        path = os.path.join(os.getcwd(), name)
+class IngestJob:
+    def __init__(self, doc_id: str, replace: bool = False):
+        self.id = uuid.uuid4().hex
+        self.doc_id = doc_id
+        self.replace = replace
+        self.status = "queued"
+        self.pages_parsed = 0
+        self.pages_total = None
+        self.chunks_embedded = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._written_at = 0.0
 
-        content = await file.read()
-        with open(path, "wb") as f:
-            f.write(content)
-
-        engine.build_from_pdf(path, doc_id=file.filename)
+    def update(self, pages_parsed: int, pages_total: int | None, chunks_embedded: int):
+        self.pages_parsed = pages_parsed
+        self.pages_total = pages_total
+        self.chunks_embedded = chunks_embedded
+        if time.time() - self._written_at >= JOB_WRITE_INTERVAL_S:
+            save_job(self)
 
+    def to_dict(self):
         return {
-            "ok": True,
-            "chunks": len(engine.chunks),
+            "job_id": self.id,
+            "doc_id": self.doc_id,
+            "replace": self.replace,
+            "status": self.status,
+            "pages_parsed": self.pages_parsed,
+            "pages_total": self.pages_total,
+            "chunks_embedded": self.chunks_embedded,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
         }
 
+
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+ingest_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="rag-ingest")
+
+
+def save_job(job: IngestJob):
+    if not JOB_DIR:
+        return
+    job._written_at = time.time()
+    try:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        path = os.path.join(JOB_DIR, f"{job.id}.json")
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.exception("Job status write failed")
+
+
+def load_job(job_id: str) -> dict | None:
+    # Başka bir worker'da çalışan ya da bitmiş iş
+    if not JOB_DIR or not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(JOB_DIR, f"{job_id}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def evict_jobs():
+    # Bellekteki kayıtlar: yalnızca bitmiş işler, en eskiden başlayarak silinir
+    with jobs_lock:
+        finished = [job_id for job_id, job in jobs.items() if job.status in JOB_FINISHED_STATUSES]
+        for job_id in finished[: max(0, len(finished) - JOB_HISTORY)]:
+            del jobs[job_id]
+
+
+def prune_jobs():
+    if not JOB_DIR:
+        return
+    try:
+        entries = [e for e in os.scandir(JOB_DIR) if e.name.endswith(".json")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        finished = []
+        for entry in entries:
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    if json.load(f).get("status") in JOB_FINISHED_STATUSES:
+                        finished.append(entry)
+            except (OSError, ValueError):
+                continue
+        for entry in finished[:-JOB_HISTORY]:
+            remove_file(entry.path)
+    except OSError:
+        logger.exception("Job status cleanup failed")
+
+
+def run_ingest_job(job: IngestJob, path: str):
+    job.status = "running"
+    job.started_at = time.time()
+    save_job(job)
+    try:
+        if job.replace:
+            engine.replace_document(job.doc_id, path, progress=job.update)
+        else:
+            engine.build_from_pdf(path, doc_id=job.doc_id, progress=job.update)
+        persist_index()
+        job.status = "done"
+        engine.compact_in_background(on_done=persist_index)
+    except Exception:
+        logger.exception("Ingest job %s failed", job.id)
+        job.error = "Upload hatası oluştu."
+        job.status = "failed"
+    finally:
+        remove_file(path)
+        job.finished_at = time.time()
+        save_job(job)
+        evict_jobs()
+        prune_jobs()
+
+
+def submit_ingest_job(path: str, doc_id: str, replace: bool = False) -> IngestJob:
+    job = IngestJob(doc_id, replace=replace)
+    with jobs_lock:
+        jobs[job.id] = job
+    save_job(job)
+    try:
+        ingest_pool.submit(run_ingest_job, job, path)
+    except Exception:
+        remove_file(path)
+        raise
+    return job
+
+
+def upload_too_large():
+    return JSONResponse(
+        {"error": f"Dosya çok büyük (en fazla {MAX_UPLOAD_MB:g} MB)."},
+        status_code=413,
+    )
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Content-Length sınırı aşan upload'lar gövde okunmadan reddedilir; uzunluğu bildirilmeyen
+    # (chunked) gövdeler receive_upload'da okunurken kesilir
+    if request.method in ("POST", "PUT") and (
+        request.url.path == "/upload" or request.url.path.startswith("/documents/")
+    ):
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+            return upload_too_large()
+    return await call_next(request)
+
+
+# Gövde elle çözüldüğü için upload alanı OpenAPI şemasına ayrıca yazılır
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+async def accept_upload(request: Request, doc_id: str | None = None, replace: bool = False):
+    try:
+        path, filename = await receive_upload(request, MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
+        return upload_too_large()
+    except InvalidUpload as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not (doc_id or filename):
+        remove_file(path)
+        return JSONResponse({"error": "Dosya adı yok."}, status_code=400)
+
+    job = submit_ingest_job(path, doc_id or filename, replace=replace)
+
+    return JSONResponse({"ok": True, **job.to_dict()}, status_code=202)
+
+
+@app.post("/upload", openapi_extra=UPLOAD_OPENAPI)
+async def upload_pdf(request: Request):
+    try:
+        return await accept_upload(request)
+
     except Exception as e:
         logger.exception("Upload failed")
         return JSONResponse(
@@ -48,13 +447,62 @@ async def upload_pdf(file: UploadFile = File(...)):
         )
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    shared_job = load_job(job_id)
+    if shared_job is None:
+        return JSONResponse({"error": "İş bulunamadı."}, status_code=404)
+    return shared_job
+
+
+# --------------------------------------------------
+# Doküman bazında listeleme / silme / değiştirme
+# --------------------------------------------------
+@app.get("/documents")
+async def list_documents():
+    return {
+        "documents": [
+            {"doc_id": doc_id, "chunks": sum(end - start for start, end in ranges)}
+            for doc_id, ranges in engine.state.doc_rows.items()
+        ]
+    }
+
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    try:
+        removed = await engine.run_blocking(engine.remove_document, doc_id)
+        if not removed:
+            return JSONResponse({"error": "Doküman bulunamadı."}, status_code=404)
+
+        await engine.run_blocking(persist_index)
+        await engine.run_blocking(engine.compact_in_background, on_done=persist_index)
+        return {"ok": True, "doc_id": doc_id, "removed_chunks": removed}
+    except Exception as e:
+        logger.exception("Delete failed")
+        return JSONResponse({"error": "Silme hatası oluştu."}, status_code=500)
+
+
+@app.put("/documents/{doc_id}", openapi_extra=UPLOAD_OPENAPI)
+async def replace_document(doc_id: str, request: Request):
+    try:
+        return await accept_upload(request, doc_id, replace=True)
+    except Exception as e:
+        logger.exception("Replace failed")
+        return JSONResponse({"error": "Upload hatası oluştu."}, status_code=500)
+
+
 # --------------------------------------------------
 # Bellegi temizle
 # --------------------------------------------------
 @app.post("/reset")
 async def reset_engine():
     try:
-        engine.reset()
+        await engine.run_blocking(engine.reset)
+        await engine.run_blocking(persist_index)
         return {"ok": True}
     except Exception as e:
         logger.exception("Reset failed")
@@ -68,16 +516,26 @@ async def reset_engine():
 async def ask(
     question: str = Form(...),
     top_k: int = Form(6),
-    doc_id: str | None = Form(None),
+    doc_id: list[str] | None = Form(None),
+    nprobe: int | None = Form(None),
+    ef_search: int | None = Form(None),
+    rerank_budget_ms: float | None = Form(None),
 ):
-    if engine.index is None:
+    if engine.state.index is None:
         return JSONResponse(
             {"error": "Henüz PDF yüklenmedi."},
             status_code=400,
         )
 
     try:
-        out = engine.ask(question, top_k=top_k, doc_id=doc_id)
+        out = await engine.aask(
+            question,
+            top_k=top_k,
+            doc_id=doc_id,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            rerank_budget_ms=rerank_budget_ms,
+        )
 
         if "hata" in out:
             logger.error("RAG error: %s", out.get("hata"))
@@ -102,25 +560,135 @@ async def ask(
 # --------------------------------------------------
 # Streaming Ask
 # --------------------------------------------------
+def sse_event(data: str, event: str | None = None) -> str:
+    # Çok satırlı veri her satır için ayrı "data:" alanı olarak gönderilir
+    head = f"event: {event}\n" if event else ""
+    return head + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+
 @app.post("/ask-stream")
 async def ask_stream(
     question: str = Form(...),
     top_k: int = Form(6),
-    doc_id: str | None = Form(None),
+    doc_id: list[str] | None = Form(None),
+    nprobe: int | None = Form(None),
+    ef_search: int | None = Form(None),
+    rerank_budget_ms: float | None = Form(None),
 ):
-    if engine.index is None:
+    if engine.state.index is None:
         return JSONResponse(
             {"error": "Henüz PDF yüklenmedi."},
             status_code=400,
         )
 
-    def event_gen():
+    async def event_gen():
         try:
-            for token in engine.ask_stream(question, top_k=top_k, doc_id=doc_id):
-                yield f"data: {token}\n\n"
-            yield "data: [DONE]\n\n"
+            async for event in engine.aask_stream(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            ):
+                if "hata" in event:
+                    logger.error("RAG stream error: %s", event["hata"])
+                    yield sse_event("[ERROR] RAG hatası oluştu.")
+                    return
+                if "kaynaklar" in event:
+                    yield sse_event(json.dumps(event["kaynaklar"], ensure_ascii=False), event="sources")
+                else:
+                    yield sse_event(event["token"])
+            yield sse_event("[DONE]")
         except Exception as e:
             logger.exception("RAG stream failed")
-            yield "data: [ERROR] RAG hatası oluştu.\n\n"
+            yield sse_event("[ERROR] RAG hatası oluştu.")
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
+
+
+# --------------------------------------------------
+# Toplu Ask (NDJSON: her cevap hazır olduğunda bir satır)
+# --------------------------------------------------
+@app.post("/ask-batch")
+async def ask_batch(
+    question: list[str] = Form(...),
+    top_k: int = Form(6),
+    doc_id: list[str] | None = Form(None),
+    nprobe: int | None = Form(None),
+    ef_search: int | None = Form(None),
+    rerank_budget_ms: float | None = Form(None),
+):
+    if engine.state.index is None:
+        return JSONResponse(
+            {"error": "Henüz PDF yüklenmedi."},
+            status_code=400,
+        )
+    if len(question) > ASK_BATCH_MAX_QUESTIONS:
+        return JSONResponse(
+            {"error": f"En fazla {ASK_BATCH_MAX_QUESTIONS} soru gönderilebilir."},
+            status_code=400,
+        )
+
+    async def line_gen():
+        answered = failed = 0
+        try:
+            async for out in engine.aask_many(
+                question,
+                top_k=top_k,
+                doc_id=doc_id,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                rerank_budget_ms=rerank_budget_ms,
+            ):
+                i = out["index"]
+                if "hata" in out:
+                    logger.error("RAG batch error (%d): %s", i, out["hata"])
+                    failed += 1
+                    row = {"index": i, "question": question[i], "error": "RAG hatası oluştu."}
+                else:
+                    answered += 1
+                    row = {"index": i, "question": question[i], "answer": out["cevap"], "sources": out["kaynaklar"]}
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.exception("RAG batch failed")
+            yield json.dumps({"error": "RAG hatası oluştu."}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps({"done": True, "answered": answered, "failed": failed}) + "\n"
+
+    return StreamingResponse(line_gen(), media_type="application/x-ndjson")
+
+
+# --------------------------------------------------
+# Çalışma istatistikleri
+# --------------------------------------------------
+@app.get("/stats")
+async def stats():
+    from rag_core import index_storage
+
+    return {
+        "chunks": engine.chunk_count(),
+        "tombstones": engine.tombstone_count(),
+        "vector_storage": index_storage(engine.state.index) if engine.state.index is not None else engine.storage,
+        "index_version": engine.version,
+        "embedding_batcher": engine.query_batcher.stats(),
+        "embedding_cache": engine.embed_cache.stats() if engine.embed_cache else None,
+        "reranker": engine.reranker.stats() if engine.reranker else None,
+        "llm_models": get_model_router().stats(),
+    }
+
+
+# --------------------------------------------------
+# Prometheus metrikleri
+# --------------------------------------------------
+@app.get("/metrics")
+async def metrics():
+    # Motor hazır değilken de cevap verir (motor gauge'ları motor açılınca dolar)
+    if engine is not None:
+        from rag_core import CHUNKS_GAUGE, INDEX_BYTES_GAUGE, index_nbytes
+
+        state = engine.state
+        CHUNKS_GAUGE.set(state.chunk_count())
+        INDEX_BYTES_GAUGE.set(index_nbytes(state.index) if state.index is not None else 0)
+
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
@@ -0,0 +1,87 @@
+import fcntl
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+# Bu modül bilerek yalnızca standart kütüphane kullanır: server.py motoru yüklemeden
+# (faiss / numpy olmadan) ortak dizin ayarını okuyabilsin.
+
+# Doluysa çok process'li mod: her worker indeksi bu dizindeki güncel sürümden salt-okunur
+# eşler; yazma işlemleri process'ler arası kilitle sırayla yeni sürüm yayınlar
+SHARED_INDEX_DIR = os.getenv("RAG_SHARED_INDEX_DIR", "")
+# Worker'ların yeni sürümü kontrol etme aralığı (sn)
+SHARED_POLL_S = float(os.getenv("RAG_SHARED_POLL_S", "1.0"))
+# Eski sürümler bir süre tutulur: yavaş worker'lar geçiş yaparken açtıkları dosyalar silinmesin
+SHARED_KEEP_VERSIONS = 3
+
+
+# --------------------------------------------------
+# SÜRÜMLÜ YAYIN DİZİNİ
+# --------------------------------------------------
+class SharedIndex:
+    # <root>/versions/<sürüm>/  : değişmez snapshot (RAGEngine.save biçimi)
+    # <root>/CURRENT            : güncel sürüm adı (boşsa korpus boş); atomik olarak değişir
+    # <root>/writer.lock        : yazarlar arası flock
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.versions_dir = os.path.join(self.root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+        self._pointer_path = os.path.join(self.root, "CURRENT")
+        self._lock_path = os.path.join(self.root, "writer.lock")
+
+    def current(self) -> str | None:
+        try:
+            with open(self._pointer_path, encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def version_path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    @contextmanager
+    def writer_lock(self):
+        # Aynı anda tek yazar (process ya da thread); ayrı open() ile alındığı için
+        # aynı process'teki iki thread de birbirini bekler
+        with open(self._lock_path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, save) -> str | None:
+        # save(path) yeni sürümü yazar; None ise boş korpus yayınlanır.
+        # Writer kilidi altında çağrılmalı.
+        version = None
+        if save is not None:
+            version = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+            save(self.version_path(version))
+
+        tmp_path = f"{self._pointer_path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version or "")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._pointer_path)
+
+        self._prune(version)
+        return version
+
+    def _prune(self, current: str | None):
+        # Sürüm adları zaman damgasıyla başlar; ad sırası = yayın sırası. Noktalı adlar
+        # yarım kalmış yazımlardan (.tmp-/.old-) artakalanlardır; kilit altında silinebilir
+        entries = os.listdir(self.versions_dir)
+        versions = sorted(v for v in entries if "." not in v)
+        stale = [v for v in entries if "." in v] + versions[:-SHARED_KEEP_VERSIONS]
+        for version in stale:
+            if version != current:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+
+def open_shared_index(root: str = SHARED_INDEX_DIR):
+    if not root:
+        return None
+    return SharedIndex(root)
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from rag_core import QueryBatcher
+
+
+def _slow_encoder(started: threading.Event, release: threading.Event):
+    def encode(texts):
+        started.set()
+        release.wait(5)
+        return np.ones((len(texts), 4), dtype="float32")
+    return encode
+
+
+def test_cancelled_query_does_not_kill_batcher():
+    started, release = threading.Event(), threading.Event()
+    batcher = QueryBatcher(_slow_encoder(started, release), max_batch=8, max_wait_ms=1)
+
+    async def scenario():
+        # İlk sorgu encode sırasında iptal edilir (istemci /ask-stream'den koptu)
+        task = asyncio.ensure_future(asyncio.wrap_future(batcher.submit("ilk")))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        # İptalden sonra kuyruğa giren sorgu encode'a hiç girmeden iptal edilir
+        queued = batcher.submit("kuyrukta")
+        queued.cancel()
+        release.set()
+
+        # Sonraki sorgu yine cevap almalı
+        vec = await asyncio.wait_for(asyncio.wrap_future(batcher.submit("sonraki")), timeout=5)
+        return task, vec
+
+    task, vec = asyncio.run(scenario())
+    assert task.cancelled()
+    assert vec.shape == (4,)
+    assert batcher._thread.is_alive()
+
+
+def test_encoder_error_keeps_batcher_alive():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            raise RuntimeError("encoder hatası")
+        return np.zeros((len(texts), 4), dtype="float32")
+
+    batcher = QueryBatcher(encode, max_batch=8, max_wait_ms=1)
+    first = batcher.submit("a")
+    try:
+        first.result(timeout=5)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("encoder hatası future'a iletilmeli")
+
+    assert batcher.encode("b").shape == (4,)
+    assert batcher._thread.is_alive()